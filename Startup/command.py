@@ -6,6 +6,7 @@ start, stop, and modify keepers and solr
 """
 
 import os
+from solrclient import SolrClient
 
 def printImportant(string):
     string = '\033[93m' + string + '\033[0m'
@@ -107,6 +108,25 @@ class Zookeeper:
         printImportant('Stopping with: %s' % command)
         os.system(command)
 
+    def ClientPort(self):
+        # reads the clientPort out of the zookeeper's config file. zkServer.sh
+        # looks for a bare file name in the conf directory, as do we.
+        # Returns None if the file or the setting can't be found
+        config_path = self.config
+        if not os.path.dirname(config_path):
+            config_path = '%s/conf/%s' % (self.zk_dir, config_path)
+        try:
+            file = open(config_path, 'r')
+        except IOError:
+            return None
+        for line in file:
+            line = line.strip()
+            if line.startswith('clientPort='):
+                file.close()
+                return int(line[len('clientPort='):])
+        file.close()
+        return None
+
 
 class CommandException(Exception):
     def __init__(self, problem):
@@ -166,6 +186,11 @@ class SolrNode:
         printImportant('Starting solr node using: %s' % command)
         os.system(command)
 
+    def Stop(self):
+        command = '%s/bin/solr stop -p %s' % (self.solr_dir, self.port)
+        printImportant('Stopping solr node using: %s' % command)
+        os.system(command)
+
 def startSolrNodes(system_config, solr_config):
     # first we get the data from the configuration
     solr_dir = system_config.properties['Solr'][0]
@@ -207,10 +232,15 @@ class SolrAdmin:
         self.solr_address = solr_address
 
     def CreateCollection(self, name, numshards, replicationfactor, configname):
-        # have to escape the ampersands
-        command = 'curl http://%s/solr/admin/collections?action=CREATE\&name=%s\&numShards=%s\&replicationFactor=%s\&collection.configName=%s' % (self.solr_address, name, numshards, replicationfactor, configname)
-        printImportant('Creating collection with command: %s' % command)
-        os.system(command)
+        # goes through the collections api directly (see solrclient.py)
+        printImportant('Creating collection %s at %s' % (name, self.solr_address))
+        client = SolrClient(self.solr_address)
+        try:
+            response = client.CreateCollection(name, numshards, replicationfactor, configname)
+        finally:
+            client.Close()
+        printImportant('Created collection %s in %s ms' % (name, response['responseHeader'].get('QTime')))
+        return response
 
 def createCollection(collection_config):
     solr_address = collection_config.properties['SolrAddress'][0]
@@ -97,6 +97,10 @@ class PhoenixConfiguration(Configuration):
         self.properties['Hadoop'] = None
         self.properties['HBase'] = None
         self.properties['Phoenix'] = None
+        # the host:port addresses used to check each has come up
+        self.properties['HadoopAddress'] = None
+        self.properties['HBaseAddress'] = None
+        self.properties['PhoenixAddress'] = None
 
 class ConfigsetConfiguration(Configuration):
     def Initiate(self):
@@ -117,3 +121,8 @@ class IndexConfiguration(Configuration):
         self.properties['Collection'] = None
         self.properties['DataDirectory'] = None
         self.properties['SolrAddress'] = None
+        self.properties['Workers'] = None      # optional, threads posting batches
+        self.properties['BatchSize'] = None    # optional, bytes per update request
+        self.properties['Manifest'] = None     # optional, index incrementally keeping this manifest
+        self.properties['UniqueKey'] = None    # optional, the field documents are keyed by
+                                               # (the uniqueKey of schema.xml, title, if not given)
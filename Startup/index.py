@@ -2,20 +2,17 @@
 
 """
 This is just a shortcut for me so I can index documents in solr really easily.
+The files in the data directory are posted in batches by several threads
+(see indexer.py) and committed once at the end. If the configuration gives
+a Manifest only the files that changed since the last run are posted (and
+the documents of files that were removed are deleted).
 """
 
-import os
 import sys
+import time
 from command import *
 from configuration import IndexConfiguration
-
-def formatString(string):
-    # replaces spaces with %20's
-    words = string.split(' ')
-    final_string = words[0]
-    for i in range(1, len(words)):
-        final_string = final_string + '%20' + words[i]
-    return final_string
+from indexer import indexDirectory, indexChanges
 
 if len(sys.argv) != 2:
     printImportant('Usage: pythonindex.py <path to index configuration file>')
@@ -23,16 +20,13 @@ if len(sys.argv) != 2:
 
 index_config = IndexConfiguration()
 index_config.UploadConfiguration(sys.argv[1])
-solr_address = index_config.properties['SolrAddress'][0]
-data_directory = index_config.properties['DataDirectory'][0]
-collection = index_config.properties['Collection'][0]
-
-command_preface = 'curl http://%s/solr/%s/update -H "Content-Type: text/xml" --data-binary @' % (solr_address, collection)
-directory = data_directory
-for filename in os.listdir(directory):
-    filename = formatString(filename)
-    printImportant('using command: %s' % (command_preface + directory + '/' + filename))
-    os.system(command_preface + directory + '/' + filename)
-# now we commit
-printImportant('using command: %s' % (command_preface[:-1] + "'<commit waitSearcher=\"false\" />'"))
-os.system(command_preface[:-1] + "'<commit waitSearcher=\"false\" />'")
+printImportant('Indexing %s into %s' % (index_config.properties['DataDirectory'][0], index_config.properties['Collection'][0]))
+start = time.time()
+if index_config.properties['Manifest']:
+    indexed, deleted, failures = indexChanges(index_config, index_config.properties['Manifest'][0])
+    printImportant('Deleted %s documents' % deleted)
+else:
+    indexed, failures = indexDirectory(index_config)
+for address, problem in failures:
+    printImportant('Failed to index %s: %s' % (address, problem))
+printImportant('Indexed %s files in %.2f seconds' % (indexed, time.time() - start))
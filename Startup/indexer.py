@@ -0,0 +1,263 @@
+# Python File indexer.py
+
+"""
+This posts solr xml files to /solr/<collection>/update with a number of
+worker threads sharing a pool of keep-alive connections, instead of one
+curl process per file.
+
+Files are packed into batches of up to batch_size bytes (a file bigger than
+that gets a batch to itself). A batch is sent as a single request by
+wrapping the contents of its files (each an <add> without its xml
+declaration) in an <update> element, which solr reads as a list of commands.
+A commit is only sent once, after every batch has been posted.
+
+With a manifest (see Manifest below) indexing is incremental: only the
+files that are new or whose contents changed are posted, and the documents
+of files that were removed (or that a changed file no longer holds) are
+deleted by their unique key (the field named by UniqueKey in the index
+configuration, title by default as in schema.xml).
+"""
+
+import os
+import re
+import sys
+import json
+import hashlib
+import tempfile
+import threading
+import Queue
+from xml.sax.saxutils import escape, unescape
+from solrhttp import ConnectionPool, SolrHTTPException
+# documentfiles.py is in the directory above this one
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from documentfiles import listDocuments
+
+WORKERS = 4
+BATCH_SIZE = 1024 * 1024    # bytes
+
+DELETE_SIZE = 1000   # ids per delete request
+KEY_FIELD = 'title'  # the uniqueKey of schema.xml
+
+declaration_expression = re.compile('^(\xef\xbb\xbf)?\s*<\?xml[^>]*\?>')
+
+class BulkIndexer:
+
+    def __init__(self, solr_address, collection, workers=WORKERS, batch_size=BATCH_SIZE):
+        self.collection = collection
+        self.workers = workers
+        self.batch_size = batch_size
+        self.pool = ConnectionPool(solr_address, workers)
+        self.path = '/solr/%s/update' % collection
+        self.headers = {'Content-Type': 'text/xml; charset=utf-8'}
+
+    def IndexFiles(self, addresses):
+        # posts the files and returns the number of files indexed and a list
+        # of (address, problem) for the batches that failed
+        batches = Queue.Queue(self.workers * 2) # so we don't get far ahead of the workers
+        results = {'indexed': 0, 'failures': []}
+        lock = threading.Lock()
+        threads = []
+        for i in range(self.workers):
+            thread = threading.Thread(target=self.postBatches, args=(batches, results, lock))
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+        try:
+            for batch in packBatches(addresses, self.batch_size):
+                batches.put(batch)
+        finally:
+            for thread in threads:
+                batches.put(None)   # tells a worker to stop
+            for thread in threads:
+                thread.join()
+        return results['indexed'], results['failures']
+
+    def postBatches(self, batches, results, lock):
+        # worker thread: posts batches until it gets None. Whatever goes
+        # wrong with a batch is a failure of its files, so the worker lives
+        # on to take the next one (were every worker to die, IndexFiles would
+        # wait forever to give them the next batch)
+        batch = batches.get()
+        while batch is not None:
+            try:
+                self.Post(batchBody(batch))
+            except Exception as exception:
+                with lock:
+                    for address in batch:
+                        results['failures'].append((address, str(exception)))
+            else:
+                with lock:
+                    results['indexed'] = results['indexed'] + len(batch)
+            batch = batches.get()
+
+    def Post(self, body):
+        status, data = self.pool.Request('POST', self.path, body, self.headers)
+        if status != 200:
+            raise SolrHTTPException('update returned %s: %s' % (status, data), status, data)
+        return data
+
+    def Commit(self):
+        return self.Post('<commit waitSearcher="false" />')
+
+    def Delete(self, ids):
+        # deletes the documents with the ids given, DELETE_SIZE at a time
+        ids = list(ids)
+        for start in range(0, len(ids), DELETE_SIZE):
+            # the ids are unicode (see documentIds), so the body is encoded
+            # like the files we post, as utf-8
+            pieces = [u'<delete>']
+            for key in ids[start:start + DELETE_SIZE]:
+                if isinstance(key, str):
+                    key = key.decode('utf-8')
+                pieces.append(u'<id>%s</id>' % escape(key))
+            pieces.append(u'</delete>')
+            self.Post(u''.join(pieces).encode('utf-8'))
+
+    def Close(self):
+        self.pool.Close()
+
+def packBatches(addresses, batch_size):
+    # yields lists of addresses whose files add up to at most batch_size bytes
+    batch = []
+    size = 0
+    for address in addresses:
+        file_size = os.path.getsize(address)
+        if batch and size + file_size > batch_size:
+            yield batch
+            batch = []
+            size = 0
+        batch.append(address)
+        size = size + file_size
+    if batch:
+        yield batch
+
+def batchBody(addresses):
+    # the body of a single update request holding every file in addresses
+    pieces = ['<update>']
+    for address in addresses:
+        file = open(address, 'rb')
+        pieces.append(declaration_expression.sub('', file.read(), 1))
+        file.close()
+    pieces.append('</update>')
+    return ''.join(pieces)
+
+class Manifest:
+    """
+    This remembers, for every file of a data directory that has been
+    indexed, the sha1 hash of its contents, its size and modification time
+    and the ids of the documents it holds. A file whose size and time
+    haven't changed isn't even read again. The manifest is a json file which
+    is saved by writing a temporary file next to it and renaming it, so it
+    is either the old manifest or the new one, never half of either.
+    """
+
+    def __init__(self, address, key_field=KEY_FIELD):
+        self.address = address
+        self.key_field = key_field  # the field the ids are read from
+        self.entries = {}   # file name -> {'hash', 'size', 'mtime', 'key', 'ids'}
+        if os.path.isfile(address):
+            file = open(address, 'r')
+            self.entries = json.load(file)
+            file.close()
+
+    def Compare(self, addresses):
+        # returns the entries the files at addresses would have now, the
+        # addresses of the files that are new or changed, and the ids of the
+        # documents that are gone (from files removed or changed)
+        entries = {}
+        changed = []
+        gone = set()
+        for address in addresses:
+            name = os.path.basename(address)
+            status = os.stat(address)
+            old = self.entries.get(name)
+            if old and old['size'] == status.st_size and old['mtime'] == status.st_mtime and old.get('key') == self.key_field:
+                entries[name] = old
+                continue
+            file = open(address, 'rb')
+            contents = file.read()
+            file.close()
+            entry = {'hash': hashlib.sha1(contents).hexdigest(), 'size': status.st_size,
+                'mtime': status.st_mtime, 'key': self.key_field, 'ids': documentIds(contents, self.key_field)}
+            entries[name] = entry
+            if old and old['hash'] == entry['hash']:
+                continue    # touched (or keyed by another field before) but not changed
+            changed.append(address)
+            if old:
+                gone.update(set(old['ids']) - set(entry['ids']))
+        for name in self.entries:
+            if name not in entries:
+                gone.update(self.entries[name]['ids'])
+        # a document that moved to another file isn't gone
+        for entry in entries.values():
+            gone.difference_update(entry['ids'])
+        return entries, changed, sorted(gone)
+
+    def Save(self, entries):
+        descriptor, temporary = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.address)))
+        file = os.fdopen(descriptor, 'w')
+        json.dump(entries, file)
+        file.close()
+        os.rename(temporary, self.address)
+        self.entries = entries
+
+def keyExpression(key_field):
+    # matches the key_field fields of a solr xml file, the value being group 1
+    return re.compile('<field\s+name\s*=\s*["\']%s["\']\s*>([^<]*)</field>' % re.escape(key_field))
+
+def documentIds(contents, key_field=KEY_FIELD):
+    # the ids (values of key_field) of the documents in the contents of a
+    # solr xml file
+    return [unescape(key.strip(), {'&quot;': '"', '&apos;': "'"}).decode('utf-8') for key in keyExpression(key_field).findall(contents)]
+
+def indexChanges(index_config, manifest_address):
+    # posts the new and changed files of the data directory, deletes the
+    # documents that are gone and commits. Only then is the manifest saved
+    # (without the files that failed, so they are tried again next time).
+    # Returns the number of files indexed, the number of documents deleted
+    # and the failures
+    key_field = KEY_FIELD
+    if index_config.properties['UniqueKey']:
+        key_field = index_config.properties['UniqueKey'][0]
+    manifest = Manifest(manifest_address, key_field)
+    entries, changed, gone = manifest.Compare(listDocuments(index_config.properties['DataDirectory'][0]))
+    indexed, failures = 0, []
+    if changed or gone:
+        indexer = newIndexer(index_config)
+        try:
+            indexed, failures = indexer.IndexFiles(changed)
+            indexer.Delete(gone)
+            indexer.Commit()
+        finally:
+            indexer.Close()
+    for address, problem in failures:
+        name = os.path.basename(address)
+        if name in manifest.entries:
+            entries[name] = manifest.entries[name]
+        else:
+            entries.pop(name, None)
+    manifest.Save(entries)
+    return indexed, len(gone), failures
+
+def newIndexer(index_config):
+    solr_address = index_config.properties['SolrAddress'][0]
+    collection = index_config.properties['Collection'][0]
+    workers = WORKERS
+    if index_config.properties['Workers']:
+        workers = int(index_config.properties['Workers'][0])
+    batch_size = BATCH_SIZE
+    if index_config.properties['BatchSize']:
+        batch_size = int(index_config.properties['BatchSize'][0])
+    return BulkIndexer(solr_address, collection, workers, batch_size)
+
+def indexDirectory(index_config):
+    # indexes every file in the data directory of an index configuration and
+    # commits. Returns the number of files indexed and the failures
+    data_directory = index_config.properties['DataDirectory'][0]
+    indexer = newIndexer(index_config)
+    try:
+        indexed, failures = indexer.IndexFiles(listDocuments(data_directory))
+        indexer.Commit()
+    finally:
+        indexer.Close()
+    return indexed, failures
@@ -0,0 +1,278 @@
+# Python File monitor.py
+
+"""
+This keeps an eye on a running solr cluster. Run it as:
+python monitor.py <system config> <keeper config> <solr config> [interval [log file [status port]]]
+
+It finds the zookeepers (through the clientPort of their config files, as
+the orchestrator does) and the solr nodes from the same configuration files
+startsolr.py uses. Every interval seconds (5 by default) every one of them
+is probed at the same time, each from its own thread:
+zookeeper       ruok (up if it answers imok, or refuses to because ruok
+                isn't whitelisted, see orchestrator.zookeeperUp) and then
+                mntr, of which we keep the server state and the
+                zookeeper's own latencies (if it is whitelisted)
+solr            a GET of /solr/admin/info/system, or with a collection of
+                /solr/<collection>/admin/ping (up if it returns 200)
+The last window probes of each are kept, and the status of a service is
+whether it is up, how long it has been up or down and the 50th, 90th and
+99th percentiles of the latency of its probes.
+
+After each round one line per service is written to the log (a file that
+is rolled over once it gets to max_bytes, or standard output for -), and
+with a status port the status of every service is served as json at
+http://localhost:<port>/.
+"""
+
+import sys
+import math
+import time
+import json
+import socket
+import httplib
+import threading
+import collections
+import BaseHTTPServer
+import SocketServer
+import logging
+import logging.handlers
+from configuration import *
+from command import *
+from orchestrator import zookeeperCommand, zookeeperUp
+
+INTERVAL = 5    # seconds between rounds of probes
+WINDOW = 100    # probes kept per service
+TIMEOUT = 2     # seconds a probe may take
+MAX_BYTES = 1024 * 1024     # of the log before it is rolled over
+BACKUPS = 3     # rolled over logs kept
+
+# PROBES -----------------------------------------------------------------------
+# a probe returns (up, details) where details is a dictionary of whatever
+# else it learned
+
+def zookeeperProbe(address, timeout=TIMEOUT):
+    def probe():
+        try:
+            answer = zookeeperCommand(address, 'ruok', timeout)
+            if not zookeeperUp(answer):
+                return False, {}
+            if answer != 'imok':
+                # mntr wouldn't be whitelisted either
+                return True, {'mntr': 'not whitelisted'}
+            answer = zookeeperCommand(address, 'mntr', timeout)
+        except socket.error as exception:
+            return False, {'error': str(exception)}
+        details = {}
+        for line in answer.splitlines():
+            parts = line.split('\t')
+            if len(parts) == 2 and parts[0] in ['zk_server_state', 'zk_avg_latency', 'zk_max_latency', 'zk_outstanding_requests', 'zk_num_alive_connections']:
+                details[parts[0][3:]] = parts[1]
+        return True, details
+    return probe
+
+def solrProbe(address, collection=None, timeout=TIMEOUT):
+    if collection:
+        path = '/solr/%s/admin/ping?wt=json' % collection
+    else:
+        path = '/solr/admin/info/system?wt=json'
+    def probe():
+        connection = httplib.HTTPConnection(address, timeout=timeout)
+        try:
+            connection.request('GET', path)
+            response = connection.getresponse()
+            response.read()
+        except (socket.error, httplib.HTTPException) as exception:
+            return False, {'error': str(exception)}
+        finally:
+            connection.close()
+        if response.status != 200:
+            return False, {'error': 'status %s' % response.status}
+        return True, {}
+    return probe
+
+# MONITOR ----------------------------------------------------------------------
+
+class Service:
+    def __init__(self, name, probe, window=WINDOW):
+        self.name = name
+        self.probe = probe
+        self.latencies = collections.deque(maxlen=window)   # seconds, of the probes that were up
+        self.results = collections.deque(maxlen=window)     # True or False
+        self.up = None
+        self.since = None   # when up last changed
+        self.details = {}
+
+    def Record(self, up, latency, details, now):
+        if up != self.up:
+            self.up = up
+            self.since = now
+        self.results.append(up)
+        if up:
+            self.latencies.append(latency)
+        self.details = details
+
+    def Status(self, now):
+        status = {'up': self.up, 'for': now - self.since if self.since else None,
+            'availability': sum(self.results) / float(len(self.results)) if self.results else None}
+        for percent in [50, 90, 99]:
+            status['p%s' % percent] = percentile(self.latencies, percent)
+        status.update(self.details)
+        return status
+
+class Monitor:
+
+    def __init__(self, interval=INTERVAL, window=WINDOW):
+        self.services = []
+        self.interval = interval
+        self.window = window
+        self.lock = threading.Lock()    # the http status is read from another thread
+        self.logger = None
+        self.server = None
+
+    def Add(self, name, probe):
+        self.services.append(Service(name, probe, self.window))
+
+    def Poll(self):
+        # probes every service at once and records the results
+        threads = []
+        for service in self.services:
+            thread = threading.Thread(target=self.pollService, args=(service,))
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join()
+        self.log()
+
+    def pollService(self, service):
+        started = time.time()
+        try:
+            up, details = service.probe()
+        except Exception as exception:
+            up, details = False, {'error': str(exception)}
+        finished = time.time()
+        with self.lock:
+            service.Record(up, finished - started, details, finished)
+
+    def Status(self):
+        # service name -> its status
+        now = time.time()
+        with self.lock:
+            return dict([(service.name, service.Status(now)) for service in self.services])
+
+    def Run(self, rounds=None):
+        # polls every interval seconds, rounds times (or forever)
+        done = 0
+        while rounds is None or done < rounds:
+            started = time.time()
+            self.Poll()
+            done = done + 1
+            if rounds is None or done < rounds:
+                time.sleep(max(0, self.interval - (time.time() - started)))
+
+    # OUTPUT -------------------------------------------------------------------
+
+    def LogTo(self, address, max_bytes=MAX_BYTES, backups=BACKUPS):
+        # writes a line per service after each round to address (rolled over
+        # at max_bytes) or to standard output if address is -
+        if address == '-':
+            handler = logging.StreamHandler(sys.stdout)
+        else:
+            handler = logging.handlers.RotatingFileHandler(address, maxBytes=max_bytes, backupCount=backups)
+        handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+        self.logger = logging.getLogger('monitor.%s' % id(self))
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+        self.logger.addHandler(handler)
+
+    def log(self):
+        if not self.logger:
+            return
+        status = self.Status()
+        for name in sorted(status):
+            self.logger.info(statusLine(name, status[name]))
+
+    def Serve(self, port, host=''):
+        # serves the status as json from a thread. Returns the port (which
+        # is chosen for us if port is 0)
+        monitor = self
+        class StatusHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = json.dumps(monitor.Status(), sort_keys=True)
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            def log_message(self, *arguments):
+                pass
+        self.server = StatusServer((host, port), StatusHandler)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self.server.server_address[1]
+
+    def Close(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+class StatusServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+def percentile(values, percent):
+    # the nearest rank percentile of values in milliseconds, or None
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, int(math.ceil(percent / 100.0 * len(ordered))) - 1)
+    return ordered[rank] * 1000
+
+def statusLine(name, status):
+    line = '%s %s' % (name, {True: 'up', False: 'down', None: 'unknown'}[status['up']])
+    if status['p50'] is not None:
+        line = line + ' p50=%.1fms p90=%.1fms p99=%.1fms' % (status['p50'], status['p90'], status['p99'])
+    for key in sorted(status):
+        if key not in ['up', 'for', 'availability', 'p50', 'p90', 'p99']:
+            line = line + ' %s=%s' % (key, status[key])
+    return line
+
+def clusterMonitor(system_config, keeper_config, solr_config, collection=None, interval=INTERVAL):
+    # a monitor for the zookeepers and solr nodes of the configurations
+    monitor = Monitor(interval)
+    zookeeper_dir = system_config.properties['Zookeeper'][0]
+    for config in keeper_config.properties['Zookeeper']:
+        port = Zookeeper(config, zookeeper_dir).ClientPort()
+        if port:
+            monitor.Add('zookeeper %s' % port, zookeeperProbe('localhost:%s' % port))
+        else:
+            printImportant('No clientPort found for %s, not monitoring it' % config)
+    for node in solr_config.properties['Solr']:
+        monitor.Add('solr %s' % node[0], solrProbe('localhost:%s' % node[0], collection))
+    return monitor
+
+if __name__ == '__main__':
+    if len(sys.argv) < 4 or len(sys.argv) > 7:
+        printImportant('Usage: python monitor.py <system config> <keeper config> <solr config> [interval [log file [status port]]]')
+        sys.exit()
+    system_config = SystemConfiguration()
+    system_config.UploadConfiguration(sys.argv[1])
+    keeper_config = KeeperConfiguration()
+    keeper_config.UploadConfiguration(sys.argv[2])
+    solr_config = SolrConfiguration()
+    solr_config.UploadConfiguration(sys.argv[3])
+    interval = INTERVAL
+    if len(sys.argv) > 4:
+        interval = float(sys.argv[4])
+    monitor = clusterMonitor(system_config, keeper_config, solr_config, interval=interval)
+    if len(sys.argv) > 5:
+        monitor.LogTo(sys.argv[5])
+    else:
+        monitor.LogTo('-')
+    if len(sys.argv) > 6:
+        printImportant('Serving the status at port %s' % monitor.Serve(int(sys.argv[6])))
+    try:
+        monitor.Run()
+    except KeyboardInterrupt:
+        monitor.Close()
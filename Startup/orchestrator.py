@@ -0,0 +1,267 @@
+# Python File orchestrator.py
+
+"""
+This file lets us bring a cluster up (and down) as a set of services instead
+of one os.system call after another. A service has a start and a stop
+command, the names of the services it has to come after, and a probe that
+tells us whether it is ready.
+
+Services are started in waves: every service whose dependencies are all
+ready is started at the same time, each in its own thread, and we then poll
+its probe until it says the service is up or the timeout runs out. The next
+wave only starts once the whole wave is ready, and if anything failed we stop
+there. Stopping goes through the waves in reverse, again a whole wave at a
+time, but carries on past a wave that failed so that everything that can be
+stopped is, and only then reports every problem at once. Both return how
+many seconds each service took, and an OrchestrationException carries the
+seconds of the services that did make it (as latencies).
+"""
+
+import time
+import socket
+import httplib
+import threading
+from command import *
+
+TIMEOUT = 120   # seconds we wait for a service to be ready
+INTERVAL = 0.5  # seconds between probes
+
+class OrchestrationException(Exception):
+    def __init__(self, problem, latencies=None):
+        self.problem = problem
+        self.latencies = latencies or {}    # of the services that succeeded
+    def __str__(self):
+        return 'ERROR: orchestration failed because of the problem: %s' % self.problem
+
+class Service:
+    def __init__(self, name, start, stop, ready=None, stopped=None, after=[]):
+        # start and stop are the commands (functions) run for the service,
+        # ready and stopped are probes (functions returning True or False)
+        # that are polled after start and after stop. after holds the names
+        # of the services that have to be ready before this one starts
+        self.name = name
+        self.start = start
+        self.stop = stop
+        self.ready = ready
+        self.stopped = stopped
+        self.after = after
+
+class Orchestrator:
+
+    def __init__(self, timeout=TIMEOUT, interval=INTERVAL):
+        self.services = []
+        self.timeout = timeout
+        self.interval = interval
+
+    def Add(self, service):
+        self.services.append(service)
+
+    def Start(self):
+        # returns a dictionary of service name -> seconds until it was ready
+        latencies = {}
+        for wave in self.waves():
+            try:
+                latencies.update(self.runWave(wave, 'start', 'ready'))
+            except OrchestrationException as exception:
+                latencies.update(exception.latencies)
+                raise OrchestrationException(exception.problem, latencies)
+        return latencies
+
+    def Stop(self):
+        # returns a dictionary of service name -> seconds until it was stopped
+        latencies = {}
+        problems = []
+        waves = self.waves()
+        waves.reverse()
+        for wave in waves:
+            try:
+                latencies.update(self.runWave(wave, 'stop', 'stopped'))
+            except OrchestrationException as exception:
+                latencies.update(exception.latencies)
+                problems.append(exception.problem)
+        if problems:
+            raise OrchestrationException('; '.join(problems), latencies)
+        return latencies
+
+    def waves(self):
+        # groups the services so that each only depends on earlier groups
+        placed = set()
+        waves = []
+        remaining = self.services
+        while remaining:
+            wave = [service for service in remaining if set(service.after) <= placed]
+            if not wave:
+                names = ', '.join([service.name for service in remaining])
+                raise OrchestrationException('services %s depend on each other or on unknown services' % names)
+            placed.update([service.name for service in wave])
+            waves.append(wave)
+            remaining = [service for service in remaining if service.name not in placed]
+        return waves
+
+    def runWave(self, wave, command, probe):
+        # runs the command of every service in wave at once and waits for their
+        # probes to pass
+        latencies = {}
+        problems = {}
+        threads = []
+        for service in wave:
+            thread = threading.Thread(target=self.runService, args=(service, command, probe, latencies, problems))
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join()
+        if problems:
+            raise OrchestrationException('; '.join(['%s: %s' % (name, problems[name]) for name in sorted(problems)]), latencies)
+        return latencies
+
+    def runService(self, service, command, probe, latencies, problems):
+        started = time.time()
+        try:
+            action = getattr(service, command)
+            if action:
+                action()
+            probe = getattr(service, probe)
+            if probe:
+                deadline = started + self.timeout
+                while not probe():
+                    if time.time() > deadline:
+                        problems[service.name] = 'not %s after %s seconds' % (probe.__name__, self.timeout)
+                        return
+                    time.sleep(self.interval)
+        except Exception as exception:
+            problems[service.name] = str(exception)
+            return
+        latencies[service.name] = time.time() - started
+
+# PROBES -----------------------------------------------------------------------
+
+def splitAddress(address):
+    host, port = address.rsplit(':', 1)
+    return host, int(port)
+
+def portOpen(address, timeout=2):
+    # returns a probe that is True once something accepts connections at address
+    def ready():
+        try:
+            connection = socket.create_connection(splitAddress(address), timeout)
+        except socket.error:
+            return False
+        connection.close()
+        return True
+    return ready
+
+def portClosed(address, timeout=2):
+    # returns a probe that is True once nothing accepts connections at address
+    is_open = portOpen(address, timeout)
+    def stopped():
+        return not is_open()
+    return stopped
+
+def zookeeperCommand(address, command, timeout=2):
+    # sends a four letter command to a zookeeper and returns its whole answer
+    connection = socket.create_connection(splitAddress(address), timeout)
+    try:
+        connection.sendall(command)
+        pieces = []
+        piece = connection.recv(4096)
+        while piece:
+            pieces.append(piece)
+            piece = connection.recv(4096)
+    finally:
+        connection.close()
+    return ''.join(pieces)
+
+def zookeeperUp(answer):
+    # whether the answer of a zookeeper to ruok means it is up: imok, or the
+    # refusal of a zookeeper that doesn't whitelist ruok (3.5.3 and later
+    # whitelist none of the four letter words by default), which only a
+    # running zookeeper sends
+    return answer == 'imok' or 'whitelist' in answer
+
+def zookeeperOk(address, timeout=2):
+    # returns a probe that sends ruok to a zookeeper and is True when it is up
+    # (see zookeeperUp). The monitor uses the same check
+    def ready():
+        try:
+            return zookeeperUp(zookeeperCommand(address, 'ruok', timeout))
+        except socket.error:
+            return False
+    return ready
+
+def httpOk(address, path, timeout=2):
+    # returns a probe that is True once a GET of path at address returns 200
+    def ready():
+        connection = httplib.HTTPConnection(address, timeout=timeout)
+        try:
+            connection.request('GET', path)
+            status = connection.getresponse().status
+        except (socket.error, httplib.HTTPException):
+            return False
+        finally:
+            connection.close()
+        return status == 200
+    return ready
+
+# CLUSTERS ---------------------------------------------------------------------
+
+def solrCluster(system_config, keeper_config, solr_config=None):
+    # the zookeepers and then the solr nodes. Without a solr configuration
+    # (as when stopping) all of the solr nodes are handled as one service
+    checkProperties(system_config, 'system')
+    checkProperties(keeper_config, 'keeper')
+    if solr_config:
+        checkProperties(solr_config, 'solr')
+    zookeeper_dir = system_config.properties['Zookeeper'][0]
+    solr_dir = system_config.properties['Solr'][0]
+    orchestrator = Orchestrator()
+    keeper_names = []
+    for config in keeper_config.properties['Zookeeper']:
+        keeper = Zookeeper(config, zookeeper_dir)
+        name = 'zookeeper %s' % config
+        port = keeper.ClientPort()
+        if not port:
+            raise OrchestrationException('no clientPort found in %s, so there is no way to tell when it is up' % config)
+        address = 'localhost:%s' % port
+        orchestrator.Add(Service(name, keeper.Start, keeper.Stop, zookeeperOk(address), portClosed(address)))
+        keeper_names.append(name)
+    if solr_config:
+        zookeepers = solr_config.properties['ZookeeperAddresses'][0]
+        for node in solr_config.properties['Solr']:
+            solr_node = SolrNode(solr_dir, node[0], node[1], zookeepers)
+            address = 'localhost:%s' % node[0]
+            orchestrator.Add(Service('solr %s' % node[0], solr_node.Start, solr_node.Stop,
+                httpOk(address, '/solr/admin/info/system?wt=json'), portClosed(address), keeper_names))
+    else:
+        orchestrator.Add(Service('solr', None, lambda: stopSolrNodes(system_config), after=keeper_names))
+    return orchestrator
+
+def phoenixCluster(phoenix_config):
+    # hadoop, then hbase, then the phoenix query server. Each is checked at the
+    # address the configuration gives for it
+    checkProperties(phoenix_config, 'phoenix')
+    properties = phoenix_config.properties
+    hadoop = Hadoop(properties['Hadoop'][0])
+    hbase = HBase(properties['HBase'][0])
+    phoenix = Phoenix(properties['Phoenix'][0])
+    addresses = {}
+    for key in ['HadoopAddress', 'HBaseAddress', 'PhoenixAddress']:
+        addresses[key] = properties[key][0]
+    orchestrator = Orchestrator()
+    orchestrator.Add(Service('hadoop', hadoop.Start, hadoop.Stop,
+        portOpen(addresses['HadoopAddress']), portClosed(addresses['HadoopAddress'])))
+    orchestrator.Add(Service('hbase', hbase.Start, hbase.Stop,
+        portOpen(addresses['HBaseAddress']), portClosed(addresses['HBaseAddress']), ['hadoop']))
+    orchestrator.Add(Service('phoenix', phoenix.Start, phoenix.Stop,
+        portOpen(addresses['PhoenixAddress']), portClosed(addresses['PhoenixAddress']), ['hbase']))
+    return orchestrator
+
+def checkProperties(config, kind):
+    # the same check startKeepers and stopKeepers make, done before the first
+    # wave so that nothing is started (or stopped) with a missing property
+    for key in sorted(config.properties):
+        if not config.properties[key]:
+            raise OrchestrationException('%s in %s configuration has value None' % (key, kind))
+
+def printLatencies(latencies):
+    for name in sorted(latencies, key=latencies.get):
+        printImportant('%s took %.2f seconds' % (name, latencies[name]))
@@ -0,0 +1,161 @@
+# Python File solrclient.py
+
+"""
+This is a client for the parts of solr's http api we use: the collections
+api (create, delete, reload, list) and updates and commits. It works
+through a ConnectionPool (see solrhttp.py), so it gets keep-alive
+connections, timeouts and retries, and every call returns solr's response
+parsed from json. A call that solr answers with an error raises a
+SolrHTTPException holding the status and the body.
+
+Only requests that can safely be sent twice are retried: updates and
+commits, and of the collections api only the actions in
+IDEMPOTENT_ACTIONS. A CREATE (or DELETE) that failed half way would only
+fail again with the collection already there (or gone), so those are sent
+once and their failure is left to the caller.
+
+Python 2 has no asyncio, so calls are run concurrently with threads:
+Concurrently takes a list of calls and runs them all at once, as many at a
+time as the client has workers, sharing the pool's connections.
+"""
+
+import json
+import urllib
+import threading
+import Queue
+from solrhttp import ConnectionPool, SolrHTTPException
+
+WORKERS = 4
+
+# the collections api actions that are retried
+IDEMPOTENT_ACTIONS = ['LIST', 'RELOAD', 'CLUSTERSTATUS']
+
+class SolrClient:
+
+    def __init__(self, solr_address, workers=WORKERS, timeout=30, retries=3):
+        self.solr_address = solr_address
+        self.workers = workers
+        self.pool = ConnectionPool(solr_address, workers, timeout, retries)
+
+    def Request(self, method, path, parameters={}, body=None, content_type=None, retry=True):
+        # returns the parsed json response of a request to path (which
+        # starts after /solr). Without retry it is only sent once
+        parameters = dict(parameters)
+        parameters['wt'] = 'json'
+        address = '/solr%s?%s' % (path, urllib.urlencode(sorted(parameters.items())))
+        headers = {}
+        if content_type:
+            headers['Content-Type'] = content_type
+        retries = None
+        if not retry:
+            retries = 0
+        status, data = self.pool.Request(method, address, body, headers, retries)
+        try:
+            response = json.loads(data)
+        except ValueError:
+            raise SolrHTTPException('%s %s returned %s and no json' % (method, address, status), status, data)
+        if status != 200 or response.get('responseHeader', {}).get('status', 0) != 0:
+            raise SolrHTTPException('%s %s returned %s: %s' % (method, address, status, errorMessage(response)), status, data)
+        return response
+
+    # COLLECTIONS --------------------------------------------------------------
+
+    def collectionsAction(self, action, parameters):
+        parameters = dict(parameters)
+        parameters['action'] = action
+        response = self.Request('GET', '/admin/collections', parameters, retry=action in IDEMPOTENT_ACTIONS)
+        if 'failure' in response:
+            # solr reports some failures of the collections api with a 200
+            raise SolrHTTPException('%s of %s failed: %s' % (action, parameters.get('name'), response['failure']), 200, json.dumps(response))
+        return response
+
+    def CreateCollection(self, name, numshards, replicationfactor, configname, **parameters):
+        # any other parameters of the CREATE action can be given by name
+        parameters.update({'name': name, 'numShards': numshards,
+            'replicationFactor': replicationfactor, 'collection.configName': configname})
+        return self.collectionsAction('CREATE', parameters)
+
+    def DeleteCollection(self, name):
+        return self.collectionsAction('DELETE', {'name': name})
+
+    def ReloadCollection(self, name):
+        return self.collectionsAction('RELOAD', {'name': name})
+
+    def ListCollections(self):
+        return self.collectionsAction('LIST', {})['collections']
+
+    # UPDATES ------------------------------------------------------------------
+
+    def Update(self, collection, documents, commit=False):
+        # adds documents (a list of dictionaries, or a json string of them)
+        if not isinstance(documents, basestring):
+            documents = json.dumps(documents)
+        if isinstance(documents, unicode):
+            documents = documents.encode('utf-8')
+        parameters = {}
+        if commit:
+            parameters['commit'] = 'true'
+        return self.Request('POST', '/%s/update' % collection, parameters, documents, 'application/json')
+
+    def UpdateXML(self, collection, body, commit=False):
+        # posts a solr xml update (an <add>, <delete> or <update> body)
+        parameters = {}
+        if commit:
+            parameters['commit'] = 'true'
+        return self.Request('POST', '/%s/update' % collection, parameters, body, 'text/xml; charset=utf-8')
+
+    def DeleteById(self, collection, ids, commit=False):
+        parameters = {}
+        if commit:
+            parameters['commit'] = 'true'
+        return self.Request('POST', '/%s/update' % collection, parameters, json.dumps({'delete': list(ids)}), 'application/json')
+
+    def Commit(self, collection, wait_searcher=False):
+        parameters = {'commit': 'true', 'waitSearcher': str(wait_searcher).lower()}
+        return self.Request('POST', '/%s/update' % collection, parameters, '{}', 'application/json')
+
+    # CONCURRENCY --------------------------------------------------------------
+
+    def Concurrently(self, calls):
+        # calls is a list of (function, arguments) such as
+        # [(client.CreateCollection, ('a', 1, 2, 'configs')), ...]. They are
+        # run workers at a time and the result of each (its response or the
+        # exception it raised) is returned in the order of calls
+        results = [None] * len(calls)
+        waiting = Queue.Queue()
+        for position in range(len(calls)):
+            waiting.put(position)
+        threads = []
+        for i in range(min(self.workers, len(calls))):
+            thread = threading.Thread(target=self.runCalls, args=(calls, waiting, results))
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join()
+        return results
+
+    def runCalls(self, calls, waiting, results):
+        # worker thread: runs calls until there are none left
+        while True:
+            try:
+                position = waiting.get_nowait()
+            except Queue.Empty:
+                return
+            function, arguments = calls[position]
+            try:
+                results[position] = function(*arguments)
+            except Exception as exception:
+                results[position] = exception
+
+    def Close(self):
+        self.pool.Close()
+
+def errorMessage(response):
+    # the error solr gave in a parsed response, as well as we can find it
+    error = response.get('error')
+    if isinstance(error, dict):
+        return error.get('msg', error)
+    if error:
+        return error
+    return response.get('failure', response.get('exception', 'unknown error'))
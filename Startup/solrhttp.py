@@ -0,0 +1,87 @@
+# Python File solrhttp.py
+
+"""
+This file holds what we need to talk to solr over http from python instead
+of through curl. Connections are kept alive and pooled, so many requests
+from many threads share a few TCP connections, and requests that fail
+(a connection problem or a 5xx from solr) are retried with backoff.
+"""
+
+import time
+import socket
+import httplib
+import Queue
+
+class SolrHTTPException(Exception):
+    def __init__(self, problem, status=None, body=None):
+        self.problem = problem
+        self.status = status
+        self.body = body
+    def __str__(self):
+        return 'ERROR: solr request failed because of the problem: %s' % self.problem
+
+class ConnectionPool:
+    """
+    This keeps up to size idle keep-alive connections to a single address
+    (host:port). A request takes an idle connection (or opens a new one) and
+    gives it back once the response has been read. A connection that fails
+    is closed rather than given back.
+    """
+
+    def __init__(self, address, size=4, timeout=30, retries=3, backoff=0.5):
+        self.address = address
+        self.timeout = timeout
+        self.retries = retries  # number of times a request is tried again
+        self.backoff = backoff  # seconds slept before the first retry, then doubled
+        self.idle = Queue.Queue(size)
+
+    def getConnection(self):
+        try:
+            return self.idle.get_nowait()
+        except Queue.Empty:
+            return httplib.HTTPConnection(self.address, timeout=self.timeout)
+
+    def putConnection(self, connection):
+        try:
+            self.idle.put_nowait(connection)
+        except Queue.Full:
+            connection.close()
+
+    def Request(self, method, path, body=None, headers={}, retries=None):
+        # returns the status and body of the response. Raises a
+        # SolrHTTPException once the retries (self.retries unless given)
+        # are used up
+        if retries is None:
+            retries = self.retries
+        attempt = 0
+        while True:
+            connection = self.getConnection()
+            try:
+                connection.request(method, path, body, headers)
+                response = connection.getresponse()
+                data = response.read()
+            except (socket.error, httplib.HTTPException) as exception:
+                connection.close()
+                problem = '%s %s to %s: %s' % (method, path, self.address, exception)
+                status = None
+                data = None
+            else:
+                if response.will_close:
+                    connection.close()
+                else:
+                    self.putConnection(connection)
+                if response.status < 500:
+                    return response.status, data
+                problem = '%s %s to %s returned %s' % (method, path, self.address, response.status)
+                status = response.status
+            if attempt >= retries:
+                raise SolrHTTPException(problem, status, data)
+            time.sleep(self.backoff * 2 ** attempt)
+            attempt = attempt + 1
+
+    def Close(self):
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except Queue.Empty:
+                return
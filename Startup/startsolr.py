@@ -1,6 +1,7 @@
 # Python File startsolr.py
 from configuration import *
 from command import *
+from orchestrator import solrCluster, printLatencies, OrchestrationException
 import sys
 
 if len(sys.argv) != 4:
@@ -20,8 +21,12 @@ solr_config = SolrConfiguration()
 solr_config.UploadConfiguration(sys.argv[3])
 
 # next we must start everything up using these configurations
-# we start with the zookeepers of course
-printImportant('Starting keepers')
-startKeepers(system_config, keeper_config)
-printImportant('Starting solr nodes')
-startSolrNodes(system_config, solr_config)
+# we start with the zookeepers of course (all at once) and then the solr nodes
+printImportant('Starting keepers and then solr nodes')
+# a problem is reported with how long the services that made it took
+try:
+    printLatencies(solrCluster(system_config, keeper_config, solr_config).Start())
+except OrchestrationException as exception:
+    printLatencies(exception.latencies)
+    printImportant(str(exception))
+    sys.exit(1)
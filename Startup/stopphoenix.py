@@ -1,6 +1,7 @@
-# Python File startphoenix.py
+# Python File stopphoenix.py
 import sys
 from command import *
+from orchestrator import phoenixCluster, printLatencies, OrchestrationException
 from configuration import PhoenixConfiguration
 
 if len(sys.argv) != 2:
@@ -9,4 +10,10 @@ if len(sys.argv) != 2:
 
 phoenix_config = PhoenixConfiguration()
 phoenix_config.UploadConfiguration(sys.argv[1])
-stopPhoenix(phoenix_config)
+# a problem is reported with how long the services that made it took
+try:
+    printLatencies(phoenixCluster(phoenix_config).Stop())
+except OrchestrationException as exception:
+    printLatencies(exception.latencies)
+    printImportant(str(exception))
+    sys.exit(1)
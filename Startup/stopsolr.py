@@ -1,6 +1,7 @@
 # Python File stopsolr.py
 from configuration import *
 from command import *
+from orchestrator import solrCluster, printLatencies, OrchestrationException
 import sys
 
 if len(sys.argv) != 3:
@@ -16,7 +17,11 @@ system_config.UploadConfiguration(sys.argv[1])
 keeper_config = KeeperConfiguration()
 keeper_config.UploadConfiguration(sys.argv[2])
 
-printImportant('Stopping SolrNodes')
-stopSolrNodes(system_config)
-printImportant('Stopping Keepers')
-stopKeepers(system_config, keeper_config)
+printImportant('Stopping SolrNodes and then Keepers')
+# a problem is reported with how long the services that made it took
+try:
+    printLatencies(solrCluster(system_config, keeper_config).Stop())
+except OrchestrationException as exception:
+    printLatencies(exception.latencies)
+    printImportant(str(exception))
+    sys.exit(1)
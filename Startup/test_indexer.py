@@ -0,0 +1,167 @@
+# Python File test_indexer.py
+
+"""
+Tests of the BulkIndexer and of incremental indexing against a stand-in
+solr update handler served by BaseHTTPServer on localhost. Run them from
+this directory with:
+python -m unittest test_indexer
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+import BaseHTTPServer
+import SocketServer
+import indexer
+from configuration import IndexConfiguration
+from indexer import BulkIndexer, indexChanges
+
+class UpdateHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    # remembers the body of every update it gets. The server's failures is a
+    # list of statuses to answer with before answering 200
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.server.requests.append((self.path, body, self.headers.get('Content-Type')))
+        status = 200
+        if self.server.failures:
+            status = self.server.failures.pop(0)
+        data = '<response><int name="status">%s</int></response>' % status
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *arguments):
+        pass
+
+class StandInServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+def solrFile(*titles):
+    pieces = ['<?xml version="1.0" encoding="UTF-8"?>\n<add>']
+    for title in titles:
+        pieces.append('<doc><field name="title">%s</field><field name="Introduction">about %s</field></doc>' % (title, title))
+    pieces.append('</add>')
+    return ''.join(pieces)
+
+class IndexerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = StandInServer(('127.0.0.1', 0), UpdateHandler)
+        self.server.requests = []
+        self.server.failures = []
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.directory = tempfile.mkdtemp()
+        self.data_directory = os.path.join(self.directory, 'data')
+        os.mkdir(self.data_directory)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.directory)
+
+    def writeFile(self, name, contents):
+        file = open(os.path.join(self.data_directory, name), 'wb')
+        file.write(contents)
+        file.close()
+
+    def indexConfiguration(self, *lines):
+        address = os.path.join(self.directory, 'index_config')
+        file = open(address, 'w')
+        file.write('Collection books\nDataDirectory %s\nSolrAddress 127.0.0.1:%s\nWorkers 2\nManifest %s\n' % (
+            self.data_directory, self.server.server_address[1], os.path.join(self.directory, 'manifest')))
+        for line in lines:
+            file.write(line + '\n')
+        file.close()
+        index_config = IndexConfiguration()
+        index_config.UploadConfiguration(address)
+        return index_config
+
+    def bulkIndexer(self, workers=2, batch_size=1024):
+        return BulkIndexer('127.0.0.1:%s' % self.server.server_address[1], 'books', workers, batch_size)
+
+    def writeFiles(self, count):
+        addresses = []
+        for i in range(count):
+            name = 'animal%s' % i
+            self.writeFile(name, solrFile('Animal %s' % i))
+            addresses.append(os.path.join(self.data_directory, name))
+        return addresses
+
+    def testBatches(self):
+        addresses = self.writeFiles(6)
+        # two files fit in a batch, three don't
+        bulk_indexer = self.bulkIndexer(batch_size=os.path.getsize(addresses[0]) * 5 / 2)
+        self.assertEqual(bulk_indexer.IndexFiles(addresses), (6, []))
+        bulk_indexer.Close()
+        self.assertEqual(len(self.server.requests), 3)
+        for path, body, content_type in self.server.requests:
+            self.assertEqual(path, '/solr/books/update')
+            self.assertEqual(content_type, 'text/xml; charset=utf-8')
+            self.assertTrue(body.startswith('<update>') and body.endswith('</add></update>'))
+            self.assertEqual(body.count('<add>'), 2)
+            self.assertFalse('<?xml' in body)
+
+    def testFailures(self):
+        addresses = self.writeFiles(3)
+        self.server.failures = [400]
+        bulk_indexer = self.bulkIndexer(workers=1, batch_size=1)
+        indexed, failures = bulk_indexer.IndexFiles(addresses)
+        bulk_indexer.Close()
+        self.assertEqual(indexed, 2)
+        self.assertEqual([address for address, problem in failures], addresses[:1])
+        self.assertTrue('400' in failures[0][1])
+
+    def testBatchErrorsDontStopTheWorkers(self):
+        # more batches than the queue holds, each failing with an error that
+        # is neither a SolrHTTPException nor an IOError
+        addresses = self.writeFiles(8)
+        batch_body = indexer.batchBody
+        def failingBody(batch):
+            raise UnicodeDecodeError('utf8', '\xff', 0, 1, 'invalid start byte')
+        indexer.batchBody = failingBody
+        try:
+            bulk_indexer = self.bulkIndexer(workers=1, batch_size=1)
+            indexed, failures = bulk_indexer.IndexFiles(addresses)
+            bulk_indexer.Close()
+        finally:
+            indexer.batchBody = batch_body
+        self.assertEqual(indexed, 0)
+        self.assertEqual(sorted([address for address, problem in failures]), addresses)
+
+    def testCommit(self):
+        bulk_indexer = self.bulkIndexer()
+        bulk_indexer.Commit()
+        bulk_indexer.Close()
+        self.assertEqual(self.server.requests[-1][:2], ('/solr/books/update', '<commit waitSearcher="false" />'))
+
+    def testChangedAndRemovedFilesAreDeleted(self):
+        self.writeFile('animals', solrFile('Bear', 'Wolf'))
+        self.writeFile('caf\xc3\xa9', solrFile('Caf\xc3\xa9 &amp; Co'))
+        index_config = self.indexConfiguration()
+        self.assertEqual(indexChanges(index_config, index_config.properties['Manifest'][0]), (2, 0, []))
+        # Wolf is taken out of animals and the other file is removed
+        self.writeFile('animals', solrFile('Bear', 'Bears again'))
+        os.remove(os.path.join(self.data_directory, 'caf\xc3\xa9'))
+        del self.server.requests[:]
+        self.assertEqual(indexChanges(index_config, index_config.properties['Manifest'][0]), (1, 2, []))
+        bodies = [body for path, body, content_type in self.server.requests]
+        self.assertTrue('<delete><id>Caf\xc3\xa9 &amp; Co</id><id>Wolf</id></delete>' in bodies)
+        self.assertTrue(bodies[-1].startswith('<commit'))
+
+    def testUniqueKey(self):
+        self.writeFile('animals', solrFile('Bear').replace('name="title"', 'name="id"'))
+        index_config = self.indexConfiguration('UniqueKey id')
+        indexChanges(index_config, index_config.properties['Manifest'][0])
+        os.remove(os.path.join(self.data_directory, 'animals'))
+        indexChanges(index_config, index_config.properties['Manifest'][0])
+        self.assertTrue('<delete><id>Bear</id></delete>' in [body for path, body, content_type in self.server.requests])
+
+if __name__ == '__main__':
+    unittest.main()
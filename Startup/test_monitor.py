@@ -0,0 +1,150 @@
+# Python File test_monitor.py
+
+"""
+Tests of the monitor's probes and of the Monitor itself against a stand-in
+zookeeper (answering four letter words over a socket) and a stand-in solr
+served by BaseHTTPServer, both on localhost. Run them from this directory
+with:
+python -m unittest test_monitor
+"""
+
+import json
+import socket
+import httplib
+import threading
+import unittest
+import BaseHTTPServer
+import SocketServer
+from monitor import Monitor, zookeeperProbe, solrProbe, statusLine
+from orchestrator import zookeeperOk
+
+NOT_WHITELISTED = 'ruok is not executed because it is not in the whitelist.\n'
+
+MNTR = ('zk_version\t3.4.14\nzk_avg_latency\t1\nzk_max_latency\t12\n'
+    'zk_outstanding_requests\t0\nzk_server_state\tstandalone\n')
+
+class KeeperHandler(SocketServer.BaseRequestHandler):
+    # answers a four letter word with the server's answer for it (or with
+    # nothing) and closes the connection, as zookeeper does
+    def handle(self):
+        command = self.request.recv(4)
+        self.server.commands.append(command)
+        self.request.sendall(self.server.answers.get(command, ''))
+
+class SolrHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    # answers every GET with the server's status
+    def do_GET(self):
+        self.server.paths.append(self.path)
+        data = json.dumps({'responseHeader': {'status': 0}, 'status': 'OK'})
+        self.send_response(self.server.status)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *arguments):
+        pass
+
+class KeeperServer(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+class SolrServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+def serve(server):
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return '127.0.0.1:%s' % server.server_address[1]
+
+def closedAddress():
+    # an address nothing listens at
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    address = '127.0.0.1:%s' % listener.getsockname()[1]
+    listener.close()
+    return address
+
+class MonitorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.keeper = KeeperServer(('127.0.0.1', 0), KeeperHandler)
+        self.keeper.commands = []
+        self.keeper.answers = {'ruok': 'imok', 'mntr': MNTR}
+        self.keeper_address = serve(self.keeper)
+        self.solr = SolrServer(('127.0.0.1', 0), SolrHandler)
+        self.solr.paths = []
+        self.solr.status = 200
+        self.solr_address = serve(self.solr)
+        self.monitor = None
+
+    def tearDown(self):
+        if self.monitor:
+            self.monitor.Close()
+        for server in [self.keeper, self.solr]:
+            server.shutdown()
+            server.server_close()
+
+    def testZookeeperUp(self):
+        up, details = zookeeperProbe(self.keeper_address)()
+        self.assertTrue(up)
+        self.assertEqual(details, {'server_state': 'standalone', 'avg_latency': '1',
+            'max_latency': '12', 'outstanding_requests': '0'})
+        self.assertEqual(self.keeper.commands, ['ruok', 'mntr'])
+
+    def testZookeeperNotWhitelisted(self):
+        # zookeeper 3.5.3 and later refuse ruok unless it is whitelisted
+        self.keeper.answers = {'ruok': NOT_WHITELISTED, 'mntr': NOT_WHITELISTED}
+        up, details = zookeeperProbe(self.keeper_address)()
+        self.assertTrue(up)
+        self.assertEqual(self.keeper.commands, ['ruok'])
+        self.assertTrue(zookeeperOk(self.keeper_address)())
+
+    def testZookeeperDown(self):
+        self.keeper.answers = {}
+        self.assertFalse(zookeeperProbe(self.keeper_address)()[0])
+        self.assertFalse(zookeeperOk(self.keeper_address)())
+        up, details = zookeeperProbe(closedAddress(), 0.5)()
+        self.assertFalse(up)
+        self.assertTrue('error' in details)
+        self.assertFalse(zookeeperOk(closedAddress(), 0.5)())
+
+    def testSolr(self):
+        self.assertEqual(solrProbe(self.solr_address)(), (True, {}))
+        self.assertEqual(self.solr.paths[-1], '/solr/admin/info/system?wt=json')
+        self.assertTrue(solrProbe(self.solr_address, 'books')()[0])
+        self.assertEqual(self.solr.paths[-1], '/solr/books/admin/ping?wt=json')
+        self.solr.status = 503
+        self.assertEqual(solrProbe(self.solr_address)(), (False, {'error': 'status 503'}))
+        self.assertFalse(solrProbe(closedAddress(), timeout=0.5)()[0])
+
+    def testMonitor(self):
+        self.monitor = Monitor(interval=0)
+        self.monitor.Add('zookeeper', zookeeperProbe(self.keeper_address))
+        self.monitor.Add('solr', solrProbe(self.solr_address))
+        self.monitor.Run(3)
+        self.solr.status = 500
+        self.monitor.Poll()
+        status = self.monitor.Status()
+        self.assertEqual(status['zookeeper']['up'], True)
+        self.assertEqual(status['zookeeper']['availability'], 1.0)
+        self.assertEqual(status['zookeeper']['server_state'], 'standalone')
+        self.assertTrue(status['zookeeper']['p99'] >= status['zookeeper']['p50'] > 0)
+        self.assertEqual(status['solr']['up'], False)
+        self.assertEqual(status['solr']['availability'], 0.75)
+        self.assertTrue(statusLine('solr', status['solr']).startswith('solr down p50='))
+
+    def testServe(self):
+        self.monitor = Monitor()
+        self.monitor.Add('solr', solrProbe(self.solr_address))
+        self.monitor.Poll()
+        port = self.monitor.Serve(0, '127.0.0.1')
+        connection = httplib.HTTPConnection('127.0.0.1', port, timeout=5)
+        connection.request('GET', '/')
+        response = connection.getresponse()
+        self.assertEqual(response.status, 200)
+        self.assertEqual(json.loads(response.read())['solr']['up'], True)
+        connection.close()
+
+if __name__ == '__main__':
+    unittest.main()
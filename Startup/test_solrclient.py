@@ -0,0 +1,145 @@
+# Python File test_solrclient.py
+
+"""
+Tests of the SolrClient against a stand-in solr served by BaseHTTPServer on
+localhost. Run them from this directory with:
+python -m unittest test_solrclient
+"""
+
+import json
+import urlparse
+import threading
+import unittest
+import BaseHTTPServer
+import SocketServer
+from solrclient import SolrClient
+from solrhttp import SolrHTTPException
+
+class StandInHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    # answers like solr does, remembering every request it got. The server's
+    # failures is a list of statuses to answer with before answering normally
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.answer(None)
+
+    def do_POST(self):
+        self.answer(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+
+    def answer(self, body):
+        path, query = self.path.split('?', 1)
+        parameters = dict(urlparse.parse_qsl(query))
+        self.server.requests.append((self.command, path, parameters, body, self.headers.get('Content-Type')))
+        if self.server.failures:
+            status = self.server.failures.pop(0)
+            self.reply(status, {'responseHeader': {'status': status}, 'error': {'msg': 'stand-in failure', 'code': status}})
+        elif parameters.get('action') == 'LIST':
+            self.reply(200, {'responseHeader': {'status': 0}, 'collections': sorted(self.server.collections)})
+        elif parameters.get('action') == 'CREATE':
+            if parameters['name'] in self.server.collections:
+                self.reply(400, {'responseHeader': {'status': 400}, 'error': {'msg': 'collection already exists: %s' % parameters['name']}})
+            else:
+                self.server.collections.add(parameters['name'])
+                self.reply(200, {'responseHeader': {'status': 0}, 'success': {}})
+        elif parameters.get('action') == 'DELETE':
+            self.server.collections.discard(parameters['name'])
+            self.reply(200, {'responseHeader': {'status': 0}, 'success': {}})
+        else:
+            self.reply(200, {'responseHeader': {'status': 0}})
+
+    def reply(self, status, response):
+        data = json.dumps(response)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *arguments):
+        pass
+
+class StandInServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+class SolrClientTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = StandInServer(('127.0.0.1', 0), StandInHandler)
+        self.server.requests = []
+        self.server.failures = []
+        self.server.collections = set()
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.client = SolrClient('127.0.0.1:%s' % self.server.server_address[1], retries=2)
+        self.client.pool.backoff = 0
+
+    def tearDown(self):
+        self.client.Close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def testCreateCollection(self):
+        response = self.client.CreateCollection('books', 2, 1, 'configs', maxShardsPerNode=2)
+        self.assertEqual(response['responseHeader']['status'], 0)
+        method, path, parameters, body, content_type = self.server.requests[-1]
+        self.assertEqual((method, path), ('GET', '/solr/admin/collections'))
+        self.assertEqual(parameters, {'action': 'CREATE', 'name': 'books', 'numShards': '2',
+            'replicationFactor': '1', 'collection.configName': 'configs', 'maxShardsPerNode': '2', 'wt': 'json'})
+        self.assertEqual(self.client.ListCollections(), ['books'])
+
+    def testDeleteCollection(self):
+        self.client.CreateCollection('books', 1, 1, 'configs')
+        self.client.DeleteCollection('books')
+        self.assertEqual(self.server.requests[-1][2]['action'], 'DELETE')
+        self.assertEqual(self.client.ListCollections(), [])
+
+    def testReloadCollection(self):
+        self.client.ReloadCollection('books')
+        self.assertEqual(self.server.requests[-1][2], {'action': 'RELOAD', 'name': 'books', 'wt': 'json'})
+
+    def testUpdate(self):
+        self.client.Update('books', [{'id': u'caf\xe9'}], commit=True)
+        method, path, parameters, body, content_type = self.server.requests[-1]
+        self.assertEqual((method, path, parameters['commit']), ('POST', '/solr/books/update', 'true'))
+        self.assertEqual(json.loads(body), [{'id': u'caf\xe9'}])
+        self.assertEqual(content_type, 'application/json')
+        self.client.UpdateXML('books', '<add><doc><field name="id">1</field></doc></add>')
+        self.assertEqual(self.server.requests[-1][4], 'text/xml; charset=utf-8')
+
+    def testCommit(self):
+        self.client.Commit('books')
+        method, path, parameters, body, content_type = self.server.requests[-1]
+        self.assertEqual((method, path), ('POST', '/solr/books/update'))
+        self.assertEqual((parameters['commit'], parameters['waitSearcher']), ('true', 'false'))
+
+    def testErrorStatus(self):
+        self.client.CreateCollection('books', 1, 1, 'configs')
+        try:
+            self.client.CreateCollection('books', 1, 1, 'configs')
+        except SolrHTTPException as exception:
+            self.assertEqual(exception.status, 400)
+            self.assertTrue('collection already exists' in str(exception))
+        else:
+            self.fail('no SolrHTTPException for an error status')
+
+    def testRetry(self):
+        self.server.failures = [503]
+        self.client.Update('books', [{'id': '1'}])
+        self.assertEqual(len(self.server.requests), 2)
+        self.server.failures = [503]
+        self.assertEqual(self.client.ListCollections(), [])
+
+    def testCreateIsNotRetried(self):
+        self.server.failures = [503]
+        self.assertRaises(SolrHTTPException, self.client.CreateCollection, 'books', 1, 1, 'configs')
+        self.assertEqual(len(self.server.requests), 1)
+
+    def testConcurrently(self):
+        calls = [(self.client.CreateCollection, ('c%s' % i, 1, 1, 'configs')) for i in range(8)]
+        results = self.client.Concurrently(calls)
+        self.assertEqual([result['responseHeader']['status'] for result in results], [0] * 8)
+        self.assertEqual(self.client.ListCollections(), ['c%s' % i for i in range(8)])
+
+if __name__ == '__main__':
+    unittest.main()
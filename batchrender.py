@@ -0,0 +1,96 @@
+# Python File batchrender.py
+
+"""
+This renders every Solr document in a directory against one template.
+Run it as:
+python batchrender.py <template> <data directory> <output directory> [processes]
+
+The template is compiled once and handed to each worker of a process pool
+when the worker starts. The workers then extract the fields of the documents
+they are given and render and write them on their own. Each output file
+gets the name of its document plus the extension of the template.
+A document missing one of the template's fields (or that fails in any
+other way) is not rendered, it is reported at the end instead.
+"""
+
+import os
+import sys
+import time
+import multiprocessing
+from fieldextractor import FieldExtractor, FieldException, compileTemplate
+from documentfiles import listDocuments
+
+# set in each worker by initializeWorker
+worker_template = None
+worker_output_directory = None
+worker_extension = None
+
+def initializeWorker(template, output_directory, extension):
+    global worker_template, worker_output_directory, worker_extension
+    worker_template = template
+    worker_output_directory = output_directory
+    worker_extension = extension
+
+def renderDocument(address):
+    # extracts, renders and writes a single document. Returns the address
+    # and None, or the address and the problem if the document had a missing
+    # field or couldn't be read, extracted or written (so that one bad
+    # document doesn't stop the others)
+    try:
+        field_extractor = FieldExtractor()
+        field_extractor.InputFile(address)
+        field_extractor.ExtractFields()
+        rendered = worker_template.Render(field_extractor)
+        if isinstance(rendered, unicode):
+            rendered = rendered.encode('utf-8')
+        name = os.path.basename(address) + worker_extension
+        file = open(os.path.join(worker_output_directory, name), 'wb')
+        file.write(rendered)
+        file.close()
+    except FieldException as exception:
+        return address, exception.problem
+    except Exception as exception:
+        return address, '%s: %s' % (exception.__class__.__name__, exception)
+    return address, None
+
+def renderDirectory(template_address, data_directory, output_directory, processes=None):
+    # renders every document in data_directory into output_directory and
+    # returns the number rendered, a list of (address, problem) for the
+    # documents that weren't and the seconds it took
+    start = time.time()
+    template = compileTemplate(template_address)
+    extension = os.path.splitext(template_address)[1]
+    if not os.path.isdir(output_directory):
+        os.makedirs(output_directory)
+    addresses = listDocuments(data_directory)
+    pool = multiprocessing.Pool(processes, initializeWorker, (template, output_directory, extension))
+    rendered = 0
+    errors = []
+    try:
+        chunksize = max(1, len(addresses) / ((processes or multiprocessing.cpu_count()) * 4))
+        for address, problem in pool.imap_unordered(renderDocument, addresses, chunksize):
+            if problem:
+                errors.append((address, problem))
+            else:
+                rendered = rendered + 1
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    return rendered, errors, time.time() - start
+
+if __name__ == '__main__':
+    if len(sys.argv) not in [4, 5]:
+        print('Usage: python batchrender.py <template> <data directory> <output directory> [processes]')
+        sys.exit()
+    processes = None
+    if len(sys.argv) == 5:
+        processes = int(sys.argv[4])
+    rendered, errors, seconds = renderDirectory(sys.argv[1], sys.argv[2], sys.argv[3], processes)
+    for address, problem in errors:
+        print('ERROR: %s was not rendered: %s' % (address, problem))
+    print('Rendered %s documents in %.2f seconds (%.1f docs/sec)' % (rendered, seconds, (rendered + len(errors)) / max(seconds, 0.000001)))
+    if errors:
+        sys.exit(1)
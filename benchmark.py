@@ -0,0 +1,425 @@
+# Python File benchmark.py
+
+"""
+This file holds benchmarks for the parts of the extraction code that have to
+deal with big documents. Run it as:
+python benchmark.py export [node counts...]
+python benchmark.py memory [node counts...]
+python benchmark.py fields [field counts...]
+python benchmark.py scan [sizes...]
+python benchmark.py suite <results file> [results file to compare with]
+
+The export benchmark builds documents of growing size (made of doc nodes with
+ten field children each, like our Solr data) and times writing each of them
+out with StructuredDocument.WriteExport. If the export is linear the time per
+node should stay about the same from the smallest to the largest document.
+
+The memory benchmark builds the same documents with the StructuredDocument
+and the CompactStructuredDocument and compares the peak memory each takes.
+Every measurement runs in its own process. If tracemalloc is available we use
+it, otherwise (as in python 2) we use the growth of the peak resident size of
+the process, which is coarser but measures the same thing.
+
+The fields benchmark writes a Solr document with a growing number of fields
+and times FieldExtractor.ExtractFields on it, keeping the tree (views of the
+field nodes) and straight from the parse events, next to deep copying every
+field node out of the tree the way the FieldExtractor used to.
+
+The scan benchmark compares the tag expression with the single pass
+MarkupScanner, on flat XML of a growing number of nodes and on tags holding a
+growing run of spaces and no > (which the tag expression has to backtrack
+over).
+
+The suite runs every hot path on synthetic input of growing size: parsing
+flat, deep and wide XML with XMLExtractor.CreateDocument, building a
+StructuredDocument, CreateExport, HTMLExtractor.ExtractHTML with a realistic
+set of rules (from a soup only if BeautifulSoup is installed, and from the
+stream of the page with AddStream either way) and rendering a template
+with a FieldTracker and joinData. For each it reports the time (best of a
+few runs), throughput in MB/s and nodes/s, and peak memory, so the sizes
+give a scaling curve. The results are saved as JSON. Given the results of
+an earlier run it flags every case whose nodes/s dropped by more than
+REGRESSION_THRESHOLD and exits with 1.
+"""
+
+import os
+import sys
+import copy
+import json
+import time
+import platform
+import tempfile
+import resource
+import multiprocessing
+from markupcreator import StructuredDocument, CompactStructuredDocument, DocumentNode, HTMLExtractor
+from xmlextractor import XMLExtractor
+from fieldextractor import FieldExtractor, FieldTracker, joinData
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+try:
+    from bs4 import BeautifulSoup
+except ImportError:
+    BeautifulSoup = None
+
+EXPORT_SIZES = [10000, 100000, 1000000, 10000000]
+MEMORY_SIZES = [10000, 100000, 1000000]
+FIELD_COUNTS = [100, 200, 500, 1000]
+SCAN_SIZES = [250, 500, 1000, 2000]
+SUITE_SIZES = [1000, 10000, 100000]
+REPEATS = 3
+REGRESSION_THRESHOLD = 0.2  # a drop in nodes/s of more than this is a regression
+
+def buildDocument(node_count, fields=10, document_class=StructuredDocument):
+    # builds a document with about node_count nodes: doc nodes each holding
+    # a number of field children
+    document = document_class()
+    created = 0
+    while created < node_count:
+        document.CreateNode('doc')
+        document.AddAttributes(id='"%s"' % created)
+        document.FinishNode(True)
+        created = created + 1
+        for i in range(fields):
+            document.CreateChild('field')
+            document.AddAttributes(name='"field%s"' % i)
+            document.AddContent(u'value of field %s in doc %s' % (i, created))
+            document.FinishNode()
+        created = created + fields
+        document.FinishChildren()
+    return document
+
+def timeExport(document):
+    # returns the seconds it takes to write the export to /dev/null
+    sink = open(os.devnull, 'wb')
+    start = time.time()
+    document.WriteExport(sink)
+    seconds = time.time() - start
+    sink.close()
+    return seconds
+
+def benchmarkExport(sizes):
+    print('%12s %12s %16s' % ('nodes', 'seconds', 'microsec/node'))
+    for size in sizes:
+        document = buildDocument(size)
+        seconds = timeExport(document)
+        print('%12d %12.3f %16.3f' % (size, seconds, seconds * 1000000 / size))
+        del document
+
+def peakMemory():
+    # peak memory of this process in bytes (ru_maxrss is in kilobytes on linux)
+    if tracemalloc:
+        return tracemalloc.get_traced_memory()[1]
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def measureChild(connection, function, args):
+    if tracemalloc:
+        tracemalloc.start()
+    before = peakMemory()
+    result = function(*args)
+    connection.send(peakMemory() - before)
+    connection.close()
+
+def measureMemory(function, *args):
+    # runs function(*args) in a new process and returns the bytes of memory
+    # it took at its peak
+    receiver, sender = multiprocessing.Pipe(False)
+    process = multiprocessing.Process(target=measureChild, args=(sender, function, args))
+    process.start()
+    used = receiver.recv()
+    process.join()
+    return used
+
+def benchmarkMemory(sizes):
+    print('%12s %20s %20s %8s' % ('nodes', 'DocumentNode b/node', 'Compact b/node', 'ratio'))
+    for size in sizes:
+        full = measureMemory(buildDocument, size, 10, StructuredDocument)
+        compact = measureMemory(buildDocument, size, 10, CompactStructuredDocument)
+        print('%12d %20.1f %20.1f %8.2f' % (size, float(full) / size, float(compact) / size, float(full) / max(compact, 1)))
+
+def writeSolrDocument(field_count):
+    # writes a Solr document with field_count fields to a temporary file and
+    # returns its address
+    descriptor, address = tempfile.mkstemp()
+    file = os.fdopen(descriptor, 'wb')
+    file.write('<?xml version="1.0" encoding="UTF-8"?>\n<add>\n<doc>\n')
+    for i in range(field_count):
+        file.write('<field name="field%s">%s</field>\n' % (i, 'some text for field %s ' % i * 10))
+    file.write('</doc>\n</add>\n')
+    file.close()
+    return address
+
+def deepcopyFields(address):
+    # how fields used to be taken out of the tree
+    xml_extractor = XMLExtractor()
+    xml_extractor.InputFile(address)
+    xml_extractor.CreateDocument()
+    fields = {}
+    for node in xml_extractor.document.nodes[0].children[0].children:
+        fields[node.attributes['name']] = copy.deepcopy(node)
+    return fields
+
+def extractFields(address, keep_tree=True):
+    field_extractor = FieldExtractor()
+    field_extractor.InputFile(address)
+    field_extractor.ExtractFields(keep_tree)
+    return field_extractor.fields
+
+def timeCall(function, *args):
+    start = time.time()
+    function(*args)
+    return time.time() - start
+
+def scanEvents(text, single_pass):
+    xml_extractor = XMLExtractor(single_pass=single_pass)
+    xml_extractor.InputString(text)
+    for event in xml_extractor.StreamEvents():
+        pass
+
+def benchmarkScan(sizes):
+    print('%8s %16s %16s %16s %16s' % ('size', 'flat regex ms', 'flat single ms', 'spaces regex ms', 'spaces single ms'))
+    for size in sizes:
+        flat = flatXML(size * 100)
+        spaces = '<root>' + ('<a' + ' ' * size + 'b') * 20 + '</root>'
+        times = [timeCall(scanEvents, text, single_pass) * 1000 for text in [flat, spaces] for single_pass in [False, True]]
+        print('%8d %16.2f %16.2f %16.2f %16.2f' % tuple([size] + times))
+
+def benchmarkFields(counts):
+    print('%8s %14s %14s %14s' % ('fields', 'deepcopy ms', 'views ms', 'events ms'))
+    for count in counts:
+        address = writeSolrDocument(count)
+        try:
+            deepcopied = '%14.2f' % (timeCall(deepcopyFields, address) * 1000)
+        except RuntimeError:
+            deepcopied = '%14s' % 'too deep'
+        views = timeCall(extractFields, address, True) * 1000
+        events = timeCall(extractFields, address, False) * 1000
+        print('%8d %s %14.2f %14.2f' % (count, deepcopied, views, events))
+        os.remove(address)
+
+# SUITE ------------------------------------------------------------------------
+
+def flatXML(node_count):
+    # one root with node_count - 1 leaf children
+    pieces = ['<add>\n']
+    for i in range(node_count - 1):
+        pieces.append('<field name="field%s">text of field %s</field>\n' % (i, i))
+    pieces.append('</add>\n')
+    return ''.join(pieces)
+
+def deepXML(node_count):
+    # node_count nodes each nested in the one before
+    pieces = ['<level depth="%s">text %s' % (i, i) for i in range(node_count)]
+    pieces.append('</level>' * node_count)
+    return ''.join(pieces)
+
+def wideXML(node_count):
+    # a root with groups of as many items as there are groups
+    width = max(1, int(node_count ** 0.5))
+    pieces = ['<root>\n']
+    created = 1
+    while created < node_count:
+        pieces.append('<group id="%s">\n' % created)
+        created = created + 1
+        for i in range(min(width, node_count - created)):
+            pieces.append('<item n="%s">item %s</item>\n' % (i, i))
+            created = created + 1
+        pieces.append('</group>\n')
+    pieces.append('</root>\n')
+    return ''.join(pieces)
+
+def htmlPage(node_count):
+    # a page of sections, each a header followed by paragraphs and a note
+    pieces = ['<html><head><title>A page</title></head><body><div id="content">\n']
+    for i in range(max(1, node_count / 6)):
+        pieces.append('<h2>Section %s</h2>\n<p>The first paragraph of section %s.</p>\n' % (i, i))
+        pieces.append('<p>The second paragraph.</p>\n<ul><li>one</li><li>two</li></ul>\n')
+    pieces.append('</div></body></html>\n')
+    return ''.join(pieces)
+
+def writeTemporary(contents):
+    descriptor, address = tempfile.mkstemp()
+    file = os.fdopen(descriptor, 'wb')
+    file.write(contents)
+    file.close()
+    return address
+
+def repNode(name, **attributes):
+    node = DocumentNode(name)
+    node.attributes.update(attributes)
+    return node
+
+def pageExtractor():
+    # an HTMLExtractor with the kind of rules we use for scraping
+    extractor = HTMLExtractor('')
+    extractor.AddExtractor(repNode('title'), extractor.titleExtractor)
+    for name in ['body', 'div', 'section', 'article', 'ul', 'ol', 'table', 'tr']:
+        extractor.AddExtractor(repNode(name), extractor.extractChildren)
+    extractor.AddExtractor(repNode('div', id='content'), extractor.extractChildren)
+    for name in ['p', 'li', 'td', 'blockquote', 'pre']:
+        extractor.AddExtractor(repNode(name), extractor.plainTextExtractor)
+    extractor.AddExtractor(repNode('div', id='sidebar'), extractor.noAction)
+    extractor.AddExtractor(repNode('h2'), extractor.rollingExtractor, [repNode('p')], [repNode('h2')])
+    return extractor
+
+def prepareParse(generator):
+    def prepare(size):
+        return writeTemporary(generator(size)), size
+    return prepare
+
+def runParse(address, size):
+    xml_extractor = XMLExtractor()
+    xml_extractor.InputFile(address)
+    xml_extractor.CreateDocument()
+    return os.path.getsize(address), size
+
+def prepareBuild(size):
+    return size, size
+
+def runParseSinglePass(address, size):
+    xml_extractor = XMLExtractor(single_pass=True)
+    xml_extractor.InputFile(address)
+    xml_extractor.CreateDocument()
+    return os.path.getsize(address), size
+
+def runBuild(size, count):
+    buildDocument(size)
+    return 0, count
+
+def prepareExport(size):
+    return buildDocument(size), size
+
+def runExport(document, size):
+    return len(document.CreateExport().encode('utf-8')), size
+
+def prepareHTML(size):
+    html = htmlPage(size)
+    return BeautifulSoup(html, 'html.parser'), len(html)
+
+def runHTML(soup, page_bytes):
+    extractor = pageExtractor()
+    extractor.AddSoup(soup)
+    extractor.ExtractHTML()
+    return page_bytes, len(soup.find_all(True))
+
+def prepareHTMLStream(size):
+    return writeTemporary(htmlPage(size)), size
+
+def runHTMLStream(address, size):
+    extractor = pageExtractor()
+    file = open(address, 'rb')
+    extractor.AddStream(file)
+    extractor.ExtractHTML()
+    file.close()
+    return os.path.getsize(address), size
+
+def prepareRender(size):
+    pieces = ['<html><head><tableName value="table" /></head><body>\n']
+    fields = {}
+    for i in range(size):
+        pieces.append('<p>Field %s is |{field%s}</p>\n' % (i, i))
+        fields['field%s' % i] = u'value %s' % i
+    pieces.append('</body></html>\n')
+    return writeTemporary(''.join(pieces)), fields
+
+def runRender(address, fields):
+    field_tracker = FieldTracker()
+    field_tracker.InputFile(address)
+    field_tracker.Process()
+    joinData(fields, field_tracker)
+    return os.path.getsize(address), len(fields)
+
+def suiteCases():
+    # (name, prepare, run): prepare(size) returns the arguments for run,
+    # which returns the bytes and nodes it went through
+    cases = [
+        ('parse flat', prepareParse(flatXML), runParse),
+        ('parse deep', prepareParse(deepXML), runParse),
+        ('parse wide', prepareParse(wideXML), runParse),
+        ('parse single', prepareParse(flatXML), runParseSinglePass),
+        ('build', prepareBuild, runBuild),
+        ('export', prepareExport, runExport),
+        ('html stream', prepareHTMLStream, runHTMLStream),
+        ('render', prepareRender, runRender)]
+    if BeautifulSoup:
+        cases.insert(6, ('html', prepareHTML, runHTML))
+    else:
+        print('BeautifulSoup is not installed, skipping html')
+    return cases
+
+def runSuite(sizes=SUITE_SIZES):
+    # returns the results as {case: {size: measurements}}
+    results = {}
+    print('%-12s %8s %10s %10s %12s %10s' % ('case', 'size', 'seconds', 'MB/s', 'nodes/s', 'peak MB'))
+    for name, prepare, run in suiteCases():
+        results[name] = {}
+        for size in sizes:
+            arguments = prepare(size)
+            seconds = None
+            for i in range(REPEATS):
+                start = time.time()
+                byte_count, node_count = run(*arguments)
+                elapsed = max(time.time() - start, 0.000001)
+                if seconds is None or elapsed < seconds:
+                    seconds = elapsed
+            peak = measureMemory(run, *arguments)
+            if isinstance(arguments[0], str) and os.path.isfile(arguments[0]):
+                os.remove(arguments[0])
+            measurement = {'seconds': seconds,
+                'bytes': byte_count,
+                'nodes': node_count,
+                'mb_per_second': byte_count / seconds / 1000000,
+                'nodes_per_second': node_count / seconds,
+                'peak_bytes': peak}
+            results[name][str(size)] = measurement
+            print('%-12s %8d %10.4f %10.2f %12.0f %10.2f' % (name, size, seconds, measurement['mb_per_second'],
+                measurement['nodes_per_second'], peak / 1000000.0))
+    return results
+
+def saveResults(results, address):
+    file = open(address, 'w')
+    json.dump({'python': platform.python_version(), 'time': time.time(), 'results': results}, file, indent=1, sort_keys=True)
+    file.close()
+
+def compareResults(results, address, threshold=REGRESSION_THRESHOLD):
+    # prints and returns the (case, size, old, new) whose nodes/s dropped by
+    # more than threshold compared to the results saved at address
+    file = open(address, 'r')
+    old_results = json.load(file)['results']
+    file.close()
+    regressions = []
+    for name in sorted(results):
+        for size in sorted(results[name], key=int):
+            if name not in old_results or size not in old_results[name]:
+                continue
+            old = old_results[name][size]['nodes_per_second']
+            new = results[name][size]['nodes_per_second']
+            if new < old * (1 - threshold):
+                regressions.append((name, size, old, new))
+                print('REGRESSION %s at %s: %.0f nodes/s down from %.0f' % (name, size, new, old))
+    return regressions
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or sys.argv[1] not in ['export', 'memory', 'fields', 'scan', 'suite']:
+        print('Usage: python benchmark.py export|memory|fields|scan [sizes...]')
+        print('   or: python benchmark.py suite <results file> [results file to compare with]')
+        sys.exit()
+    if sys.argv[1] == 'suite':
+        if len(sys.argv) not in [3, 4]:
+            print('Usage: python benchmark.py suite <results file> [results file to compare with]')
+            sys.exit()
+        results = runSuite()
+        saveResults(results, sys.argv[2])
+        if len(sys.argv) == 4 and compareResults(results, sys.argv[3]):
+            sys.exit(1)
+        sys.exit()
+    sizes = [int(size) for size in sys.argv[2:]]
+    if sys.argv[1] == 'export':
+        benchmarkExport(sizes or EXPORT_SIZES)
+    elif sys.argv[1] == 'memory':
+        benchmarkMemory(sizes or MEMORY_SIZES)
+    elif sys.argv[1] == 'fields':
+        benchmarkFields(sizes or FIELD_COUNTS)
+    elif sys.argv[1] == 'scan':
+        benchmarkScan(sizes or SCAN_SIZES)
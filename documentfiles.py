@@ -0,0 +1,25 @@
+# Python File documentfiles.py
+
+"""
+This finds the documents the batch scripts (batchrender.py, fieldcorpus.py,
+scrapepipeline.py and solrbatch.py) work on: the files directly within a
+directory, or the files matching a glob such as SolrData/*.xml.
+"""
+
+import os
+import glob
+
+def listDocuments(data_directory):
+    # the files (not directories) directly within data_directory
+    addresses = []
+    for filename in sorted(os.listdir(data_directory)):
+        address = os.path.join(data_directory, filename)
+        if os.path.isfile(address):
+            addresses.append(address)
+    return addresses
+
+def listCorpus(source):
+    # the files of a directory or the files matching a glob
+    if os.path.isdir(source):
+        return listDocuments(source)
+    return [address for address in sorted(glob.glob(source)) if os.path.isfile(address)]
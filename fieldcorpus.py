@@ -0,0 +1,106 @@
+# Python File fieldcorpus.py
+
+"""
+This extracts the fields of a whole corpus of Solr documents (a directory
+or a glob such as SolrData/*.xml) with a process pool, one FieldExtractor
+per file. Run it as:
+python fieldcorpus.py <directory or glob> [processes]
+
+Each document is keyed by its file name, or by the content of one of its
+fields if key_field is given (id for instance). The fields of a document are
+a dictionary of field name -> FieldView, just like FieldExtractor.fields.
+
+extractCorpus waits for every file and returns a dictionary of key -> fields
+while streamCorpus yields (key, fields) as the workers finish them. A file
+that can't be read or extracted (a malformed one included, see
+XMLExtractor's strict) doesn't stop the others, it is reported as
+(address, problem) instead and left out of the corpus.
+"""
+
+import os
+import sys
+import time
+import multiprocessing
+from fieldextractor import FieldExtractor
+from documentfiles import listCorpus
+
+# set in each worker by initializeWorker
+worker_key_field = None
+
+def initializeWorker(key_field):
+    global worker_key_field
+    worker_key_field = key_field
+
+def extractDocument(address):
+    # returns the address, the key and the fields of a single document, or
+    # the address, None and the problem if it couldn't be extracted
+    try:
+        field_extractor = FieldExtractor(strict=True)
+        field_extractor.InputFile(address)
+        field_extractor.ExtractFields(False)
+    except Exception as exception:
+        return address, None, '%s: %s' % (exception.__class__.__name__, exception)
+    if worker_key_field is None:
+        return address, os.path.basename(address), field_extractor.fields
+    if worker_key_field not in field_extractor.fields:
+        return address, None, 'no field %s to key the document by' % worker_key_field
+    return address, field_extractor[worker_key_field], field_extractor.fields
+
+def extractDocuments(source, processes=None, key_field=None):
+    # yields what extractDocument returns for every file of source, in the
+    # order the workers finish them
+    addresses = listCorpus(source)
+    if not addresses:
+        return
+    pool = multiprocessing.Pool(processes, initializeWorker, (key_field,))
+    try:
+        chunksize = max(1, len(addresses) / ((processes or multiprocessing.cpu_count()) * 4))
+        for result in pool.imap_unordered(extractDocument, addresses, chunksize):
+            yield result
+    finally:
+        # every result is in (or the caller stopped reading early), so
+        # there is nothing left to wait for
+        pool.terminate()
+        pool.join()
+
+def streamCorpus(source, processes=None, key_field=None, errors=None):
+    # yields (key, fields) for every document of source as it is finished.
+    # The documents that fail are appended to errors as (address, problem)
+    # if it is given
+    for address, key, fields in extractDocuments(source, processes, key_field):
+        if key is None:
+            if errors is not None:
+                errors.append((address, fields))
+            continue
+        yield key, fields
+
+def extractCorpus(source, processes=None, key_field=None):
+    # returns a dictionary of key -> fields for every document of source and
+    # a list of (address, problem) for the documents that failed (a document
+    # whose key was already taken is one of those)
+    corpus = {}
+    errors = []
+    for address, key, fields in extractDocuments(source, processes, key_field):
+        if key is None:
+            errors.append((address, fields))
+        elif key in corpus:
+            errors.append((address, 'duplicate key %s' % key))
+        else:
+            corpus[key] = fields
+    return corpus, errors
+
+if __name__ == '__main__':
+    if len(sys.argv) not in [2, 3]:
+        print('Usage: python fieldcorpus.py <directory or glob> [processes]')
+        sys.exit()
+    processes = None
+    if len(sys.argv) == 3:
+        processes = int(sys.argv[2])
+    start = time.time()
+    corpus, errors = extractCorpus(sys.argv[1], processes)
+    seconds = time.time() - start
+    for address, problem in errors:
+        print('ERROR: %s was not extracted: %s' % (address, problem))
+    print('Extracted %s documents in %.2f seconds (%.1f docs/sec)' % (len(corpus), seconds, (len(corpus) + len(errors)) / max(seconds, 0.000001)))
+    if errors:
+        sys.exit(1)
@@ -2,48 +2,114 @@
 
 """
 This will allow us to read in a structured document. Find the nodes
-with the name field, and then copy them over another class which
+with the name field, and then keep a view of them in another class which
 allows you to access them by name as if from a dictionary.
 """
 
-import copy
 from xmlextractor import XMLExtractor
+import instrumentation
+
+class FieldException(Exception):
+    def __init__(self, problem):
+        self.problem = problem
+    def __str__(self):
+        return 'ERROR: field lookup failed because of the problem: %s' % self.problem
+
+class FieldView(object):
+    """
+    This is what we keep for a field: its name, content and attributes,
+    read-only and shared with the parse they came from (nothing is copied).
+    It looks like a standalone DocumentNode without parent, siblings or
+    children. As with a CompactNode, attributes gives a copy of the
+    dictionary, so changing it changes neither the field nor the parse.
+    """
+    __slots__ = ('_name', '_content', '_attributes')
+    parent = None
+    older_sibling = None
+    younger_sibling = None
+    children = None
+
+    def __init__(self, name, content, attributes):
+        self._name = name
+        self._content = content
+        self._attributes = attributes
+
+    @property
+    def name(self):
+        return self._name
+
+    @property
+    def content(self):
+        return self._content
+
+    @property
+    def attributes(self):
+        return dict(self._attributes)
 
 class FieldExtractor:
     """
     This takes in an xml document and pulls out the fields
     """
 
-    def __init__(self, directory=''):
+    def __init__(self, directory='', cache=None, strict=False):
+        # cache is an optional ParseCache shared with other extractors. With
+        # strict a malformed document raises a MarkupException (see
+        # XMLExtractor) instead of giving the fields found before the problem
         self.fields = {}
         self.directory = directory
-        self.xml_extractor = XMLExtractor(directory)
+        self.xml_extractor = XMLExtractor(directory, cache=cache, strict=strict)
 
-    def InputFile(self, address):
-        self.xml_extractor.InputFile(address)
+    def InputFile(self, address, mapped=False):
+        # mapped files only have the content of the nodes read decoded
+        # (see XMLExtractor.InputFile)
+        self.xml_extractor.InputFile(address, mapped)
 
-    def ExtractFields(self):
+    def ExtractFields(self, keep_tree=True):
+        # if keep_tree is False we take the fields straight from the parse
+        # events and no document is built at all
+        # The fields hold their content decoded, so the file (and its map,
+        # see XMLExtractor.InputFile) is closed once they have been read
         self.fields = {}
-        self.xml_extractor.CreateDocument()
-        structured_doc = self.xml_extractor.document
-        for node in structured_doc.nodes:
-            self.extract(node)
+        try:
+            if not keep_tree:
+                self.extractEvents(self.xml_extractor.StreamEvents())
+                return
+            self.xml_extractor.CreateDocument()
+            structured_doc = self.xml_extractor.document
+            for node in structured_doc.FindAll('field'):
+                self.addField(node)
+        finally:
+            self.xml_extractor.Close()
 
     def extract(self, node):
-        # this will add the node
-        if node.name == 'field':
-            self.fields[node.attributes['name'][1:-1]] = self.processNode(node) # we have to cut off the quotations on the attribute
-        for child in node.children:
-            self.extract(child)
+        # this will add the fields within the node (and the node itself)
+        for node in self.xml_extractor.document.PreOrder(node):
+            if node.name == 'field':
+                self.addField(node)
+
+    def addField(self, node):
+        self.fields[node.attributes['name'][1:-1]] = self.processNode(node) # we have to cut off the quotations on the attribute
+
+    def extractEvents(self, events):
+        # content always belongs to the last node started, so we only have
+        # to remember the last field started
+        field = None
+        for event in events:
+            if event[0] == 'start':
+                field = None
+                if event[1] == 'field':
+                    field = event[2]
+            elif event[0] == 'content' and field:
+                self.fields[field['name'][1:-1]] = FieldView('field', event[1], field)
+                field = None
+            elif event[0] == 'end' and field:
+                # a field without content
+                self.fields[field['name'][1:-1]] = FieldView('field', None, field)
+                field = None
 
     def processNode(self, node):
-        # this just creates a modified node so it is a standalone without children
-        new_node = copy.deepcopy(node)
-        new_node.parent = None
-        new_node.older_sibling = None
-        new_node.younger_sibling = None
-        new_node.children = None
-        return new_node
+        # this just creates a view of the node as a standalone without children
+        return FieldView(node.name, node.content, node.attributes)
 
     def __getitem__(self, key):
         # so that we can access the field node content off of this object like accessing a dictionary
@@ -63,49 +129,67 @@ class FieldTracker:
 
     Name tag is like <tableName value="table_name" />
     """
-    def __init__(self, directory=''):
+    def __init__(self, directory='', cache=None, single_pass=False):
+        # with single_pass no document is built, the table name and the
+        # markers are found together in one scan of the text (see scanTemplate)
         self.found_tag = False
         self.field_markers = []
         self.directory = directory
-        self.xml_extractor = XMLExtractor(directory)
+        self.single_pass = single_pass
+        self.xml_extractor = XMLExtractor(directory, cache=cache)
         self.expression = re.compile('\|\{([^\{\} ]*)\}')
+        self.template_expression = re.compile('<tableName\\s(?:[^<>]*?\\s)?value=("[^"]*"|\'[^\']*\'|[^\\s<>/]*)[^<>]*>|\|\{([^\{\} ]*)\}')
+            # either a tableName tag, with its value (quotes and all) in
+            # group one, or a field marker with the field name in group two
         self.text = ''
 
     def InputFile(self, address):
-        self.xml_extractor.InputFile(address)
+        # we read the file once, the xml extractor works from the same text
         self.file = address
+        self.text = open(address, 'r').read()
+        self.xml_extractor.InputString(self.text, address)
 
     def Process(self):
+        if self.single_pass:
+            self.scanTemplate()
+            return
         # first we get the table name
         self.getTableName()
         self.findFieldMarkers()
 
+    def scanTemplate(self):
+        # finds the table name and the field markers in a single run of the
+        # template expression. Only the first tableName counts
+        text = self.text
+        prior = []
+        for match in self.template_expression.finditer(text):
+            if match.group(1) is not None:
+                if not self.found_tag:
+                    self.table_name = match.group(1)[1:-1]
+                    self.found_tag = True
+            elif match.start() == 0 or text[match.start() - 1] != '\\':
+                prior.append((match.start(), match.end(), match.group(2)))
+        prior.reverse()
+        self.field_markers.extend(prior)
+
     def getTableName(self):
         self.xml_extractor.CreateDocument()
-        for node in self.xml_extractor.document.nodes:
-            self.findNameTag(node)
-            if self.found_tag == True:
-                break
+        self.findNameTag(self.xml_extractor.document)
 
-    def findNameTag(self, node):
+    def findNameTag(self, document):
         if not self.found_tag:
-            if node.name == 'tableName':
+            node = document.Find('tableName')
+            if node:
                 self.table_name = node.attributes['value'][1:-1]
                 self.found_tag = True
-            for child in node.children:
-                if self.found_tag == True:
-                    break
-                self.findNameTag(child)
 
     def findFieldMarkers(self):
-        # first we read the file
-        text = open(self.file, 'r').read()
-        self.text = text
+        text = self.text
         prior = []
         # next we look for matches for fieldmarkers
         for match in re.finditer(self.expression, text):
             # next we make sure the pipe isn't escaped by looking at the char before
-            if text[match.start() - 1] == '\\':
+            if match.start() > 0 and text[match.start() - 1] == '\\':
                 continue
             # alright, so we know it isn't escaped, so we record it
             to_append = (match.start(), match.end(), match.group(1)) # the index of the start of the match, the end, and the field name
@@ -115,25 +199,68 @@ class FieldTracker:
         # work right through the list from front to back without worrying about changing indices we need
         # to keep track of
         for i in range(-1, -len(prior) - 1, -1):
-            print i
             self.field_markers.append(prior[i])
 
+class CompiledTemplate:
+    """
+    This holds a template, as found by a FieldTracker, split up into the
+    pieces of text between field markers and the markers themselves. So the
+    template is only read and scanned once, and rendering a document is a
+    single join, no matter how many markers there are. One compiled template
+    can be rendered for as many documents as you like.
+    """
+
+    def __init__(self, field_tracker):
+        self.table_name = getattr(field_tracker, 'table_name', None)
+        self.segments = []  # literal text, with None where a field goes
+        self.fields = []    # (index in segments, field name)
+        text = field_tracker.text
+        position = 0
+        for start, end, field in sorted(field_tracker.field_markers):
+            self.segments.append(text[position:start])
+            self.fields.append((len(self.segments), field))
+            self.segments.append(None)
+            position = end
+        self.segments.append(text[position:])
+
+    def Render(self, field_dictionary):
+        # field_dictionary just needs to act like a dictionary, a field
+        # extractor works just fine here
+        # an empty field (content None) is rendered as nothing
+        stats = instrumentation.current
+        if stats:
+            with stats.Time('render'):
+                return self.render(field_dictionary)
+        return self.render(field_dictionary)
+
+    def render(self, field_dictionary):
+        pieces = list(self.segments)
+        for index, field in self.fields:
+            try:
+                value = field_dictionary[field]
+            except KeyError:
+                raise FieldException('template field %s is missing from the document' % field)
+            if value is None:
+                value = ''
+            pieces[index] = value
+        return ''.join(pieces)
+
+def compileTemplate(address, directory='', cache=None, single_pass=True):
+    # this processes the template at address and returns it compiled. The
+    # single pass is the default here, as a compiled template never needs
+    # the document
+    field_tracker = FieldTracker(directory, cache, single_pass)
+    field_tracker.InputFile(address)
+    field_tracker.Process()
+    return CompiledTemplate(field_tracker)
+
 """
 The following function takes a FieldMarker (that has processed everything) and a FieldExtractor (which has processed
 things) and returns the newly made HTML
 """
 
 def joinData(field_dictionary, field_tracker):
-    # so we just loop through the field markers and make our replacements as we go
-    text = field_tracker.text
-    for tup in field_tracker.field_markers:
-        start = tup[0]
-        end = tup[1]
-        field = tup[2]
-        value = field_dictionary[field] # just needs to act like a dictionary
-                                        # a field extractor works just fine here
-        text = text[0:start] + value + text[end:] # yes you would think it would be
-                # end + 1, but just end works :/ guessing match.end() returns
-                # the 'end' of the substring such that text[start:end] returns the
-                # match
-    return text
+    # we compile the template and fill in all of the markers in one go. If you
+    # render more than one document with the same template use a
+    # CompiledTemplate directly so it is only compiled once
+    return CompiledTemplate(field_tracker).Render(field_dictionary)
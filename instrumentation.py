@@ -0,0 +1,218 @@
+# Python File instrumentation.py
+
+"""
+This lets us see where the time goes in a run of the extraction pipeline.
+Instrumentation is off unless a Stats object is being collected, and while
+it is off the pipeline only checks for one once per document (or per soup),
+so it costs nothing. Turn it on around a run with:
+
+with instrumented() as stats:
+    ...
+print(stats.Report())
+
+While it is on we collect:
+bytes scanned, tags scanned     XMLExtractor (rates are per second of parse)
+nodes created, max depth        StructuredDocument.ApplyEvents
+dispatch <rule>                 HTMLExtractor, per rule that matched (its tag
+                                name and attributes, or noAction), with the
+                                time spent in each as extractor <rule>
+and the time spent in the stages parse, build, export and render. Times are
+exclusive: the time a stage spends waiting on another (build waiting on the
+parse for its next event, an extractor calling extract for its children)
+is counted for that other stage only.
+
+profiled wraps a run in cProfile (or, with memory, in tracemalloc, which
+python 2 doesn't have, so there we report the growth of the peak resident
+memory instead) and writes the report to a file or prints it.
+"""
+
+import sys
+import time
+import contextlib
+import cProfile
+import pstats
+from cStringIO import StringIO
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+try:
+    import resource
+except ImportError:
+    resource = None
+
+LIMIT = 20  # lines of the profile reports
+
+current = None  # the Stats being collected, None while instrumentation is off
+
+class Stats:
+
+    def __init__(self):
+        self.counters = {}
+        self.maxima = {}
+        self.timings = {}   # stage -> [calls, seconds]
+        self.stack = []     # [stage, start, seconds spent in nested stages]
+
+    def Count(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def Maximum(self, name, value):
+        if value > self.maxima.get(name, value - 1):
+            self.maxima[name] = value
+
+    def enter(self, stage):
+        self.stack.append([stage, time.time(), 0.0])
+
+    def leave(self):
+        stage, start, nested = self.stack.pop()
+        elapsed = time.time() - start
+        timing = self.timings.setdefault(stage, [0, 0.0])
+        timing[0] = timing[0] + 1
+        timing[1] = timing[1] + elapsed - nested
+        if self.stack:
+            self.stack[-1][2] = self.stack[-1][2] + elapsed
+
+    @contextlib.contextmanager
+    def Time(self, stage):
+        self.enter(stage)
+        try:
+            yield
+        finally:
+            self.leave()
+
+    def Timed(self, stage, iterator, counter=None):
+        # yields what iterator does, timing each step as stage and counting
+        # the items under counter if it is given
+        iterator = iter(iterator)
+        count = 0
+        try:
+            while True:
+                self.enter(stage)
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    self.leave()
+                count = count + 1
+                yield item
+        finally:
+            if counter:
+                self.Count(counter, count)
+
+    def Counted(self, name, iterator, measure=len):
+        # yields what iterator does, adding up measure of each item under name
+        for item in iterator:
+            self.Count(name, measure(item))
+            yield item
+
+    def Seconds(self, stage):
+        return self.timings.get(stage, [0, 0.0])[1]
+
+    def Rates(self):
+        # the rates worth knowing, per second of the stage they belong to
+        rates = {}
+        parse = self.Seconds('parse')
+        if parse:
+            for name in ['bytes scanned', 'tags scanned']:
+                if name in self.counters:
+                    rates[name + ' per second'] = self.counters[name] / parse
+        dispatches = self.counters.get('dispatches')
+        if dispatches:
+            rates['noAction ratio'] = float(self.counters.get('dispatch noAction', 0)) / dispatches
+        return rates
+
+    def Snapshot(self):
+        # everything collected as a dictionary (easy to save as json)
+        timings = {}
+        for stage in self.timings:
+            timings[stage] = {'calls': self.timings[stage][0], 'seconds': self.timings[stage][1]}
+        return {'counters': dict(self.counters), 'maxima': dict(self.maxima),
+            'timings': timings, 'rates': self.Rates()}
+
+    def Report(self):
+        lines = ['%-32s %10s %12s' % ('stage', 'calls', 'seconds')]
+        for stage in sorted(self.timings, key=self.Seconds, reverse=True):
+            lines.append('%-32s %10d %12.4f' % (stage, self.timings[stage][0], self.timings[stage][1]))
+        lines.append('')
+        for name in sorted(self.counters):
+            lines.append('%-32s %10d' % (name, self.counters[name]))
+        for name in sorted(self.maxima):
+            lines.append('%-32s %10d' % (name, self.maxima[name]))
+        rates = self.Rates()
+        for name in sorted(rates):
+            lines.append('%-32s %14.2f' % (name, rates[name]))
+        return '\n'.join(lines)
+
+    def Reset(self):
+        self.__init__()
+
+def Enable(stats=None):
+    # starts collecting into stats (or a new Stats) and returns it
+    global current
+    if stats is None:
+        stats = Stats()
+    current = stats
+    return stats
+
+def Disable():
+    global current
+    current = None
+
+@contextlib.contextmanager
+def instrumented(stats=None):
+    # collects stats for the block, then goes back to what was collected before
+    global current
+    previous = current
+    stats = Enable(stats)
+    try:
+        yield stats
+    finally:
+        current = previous
+
+@contextlib.contextmanager
+def profiled(address=None, memory=False, limit=LIMIT):
+    # profiles the block and writes the report to address (or prints it)
+    if not memory:
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            stream = StringIO()
+            pstats.Stats(profile, stream=stream).sort_stats('cumulative').print_stats(limit)
+            writeReport(stream.getvalue(), address)
+    elif tracemalloc:
+        tracemalloc.start()
+        try:
+            yield
+        finally:
+            snapshot = tracemalloc.take_snapshot()
+            size, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            lines = ['peak traced memory: %d bytes' % peak]
+            lines.extend([str(statistic) for statistic in snapshot.statistics('lineno')[:limit]])
+            writeReport('\n'.join(lines) + '\n', address)
+    else:
+        before = peakMemory()
+        try:
+            yield
+        finally:
+            after = peakMemory()
+            writeReport('peak resident memory: %d bytes (grew by %d bytes)\n' % (after, after - before), address)
+
+def peakMemory():
+    # the peak resident memory of this process in bytes (ru_maxrss is in
+    # kilobytes on linux)
+    if not resource:
+        return 0
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def writeReport(report, address):
+    if address:
+        file = open(address, 'w')
+        file.write(report)
+        file.close()
+    else:
+        sys.stdout.write(report)
@@ -11,6 +11,15 @@ the following form:
 </tagname>
 """
 
+from array import array
+import json
+import codecs
+import collections
+import contextlib
+import htmlentitydefs
+import HTMLParser
+import instrumentation
+
 class DocumentNode:
     """
     This will be a document node object which has a name, attributes, content and the
@@ -37,6 +46,46 @@ class DocumentNode:
         self.younger_sibling = sibling
         sibling.older_sibling = self
 
+class ContentSpan(object):
+    """
+    This stands for content that hasn't been decoded yet: length bytes at
+    offset in buffer (the memory map of a file, see XMLExtractor.InputFile).
+    Decode gives the text
+    """
+    __slots__ = ('buffer', 'offset', 'length')
+
+    def __init__(self, buffer, offset, length):
+        self.buffer = buffer
+        self.offset = offset
+        self.length = length
+
+    def Decode(self, encoding='utf-8'):
+        return self.buffer[self.offset:self.offset + self.length].decode(encoding)
+
+def decodeContent(content):
+    if isinstance(content, ContentSpan):
+        return content.Decode()
+    return content
+
+class LazyDocumentNode(DocumentNode, object):
+    """
+    This is a DocumentNode whose content may be given as a ContentSpan. The
+    span is only decoded the first time content is read, so the content of
+    nodes nobody looks at is never copied out of the file
+    """
+
+    @property
+    def content(self):
+        content = self._content
+        if isinstance(content, ContentSpan):
+            content = content.Decode()
+            self._content = content
+        return content
+
+    @content.setter
+    def content(self, content):
+        self._content = content
+
 class StructuredDocument:
     """
     This is an object designed for easy creation and exporting
@@ -57,14 +106,34 @@ class StructuredDocument:
     Finally the various root nodes get added to a node list to keep track of them
 
     Therefore you must work depth first in creating these structured pages
+
+    Builder returns a DocumentBuilder, which does the same with a stack of
+    open nodes, raises a StructureException instead of ignoring you and can
+    add a whole subtree from nested tuples at once
+
+    node_class is the class of the nodes created (XMLExtractor sets it to
+    LazyDocumentNode when it reads a memory mapped file)
+
+    QUERIES:
+    Every node is added to an index by name as it is created (and, with
+    index_attributes, to an index by attribute key and value as its
+    attributes are added), so Find and FindAll only look at the nodes with
+    the name or attribute asked for instead of walking the whole document.
+    PreOrder and PostOrder walk the nodes without recursion, so they work
+    however deep the document is.
     """
+    node_class = DocumentNode
 
-    def __init__(self, directory=''):
+    def __init__(self, directory='', index_attributes=False):
         self.directory = directory
         self.nodes = []
         self.current_node = None
         self.current_parent = None
         self.last_sibling = None
+        self.indexed = True # False once ApplyEvents is streaming the roots away
+        self.index_attributes = index_attributes
+        self.name_index = {}        # name -> nodes in the order they were created
+        self.attribute_index = {}   # (key, value without quotes) -> nodes
 
     # CREATION -----------------------------------------------------------------
 
@@ -82,7 +151,8 @@ class StructuredDocument:
     def CreateNode(self, node_name):
         # we will create a node with the appropriate node_name
         if self.ReadyForAction():
-            self.current_node = DocumentNode(node_name)
+            self.current_node = self.node_class(node_name)
+            self.indexNode(self.current_node)
 
     def AddContent(self, content):
         # this will add content to the current node
@@ -97,6 +167,7 @@ class StructuredDocument:
         if self.current_node:
             for key in attributes:
                 self.current_node.attributes[key] = attributes[key]
+            self.indexAttributes(attributes)
         else:
             print "No node in process of creation, skipping attributes addition"
 
@@ -127,7 +198,8 @@ class StructuredDocument:
         # if last_sibling exists will set up the sibling relationship as well
         if self.current_parent:
             if self.ReadyForAction():
-                self.current_node = DocumentNode(node_name)
+                self.current_node = self.node_class(node_name)
+                self.indexNode(self.current_node)
                 self.current_parent.AddChild(self.current_node)
                 if self.last_sibling:
                     self.last_sibling.AddYoungerSibling(self.current_node)
@@ -139,61 +211,725 @@ class StructuredDocument:
         # for a specific node. Now there may be a case where we
         # stepped into a child that was created to create its children
         # and now want to step back. So this is going to step back for us
-        # and set both current_parent and last_sibling
+        # and set both current_parent and last_sibling. As we work depth
+        # first, the parent we are leaving was the last child created under
+        # its own parent, so it becomes the last sibling without walking
+        # any chain
         if self.current_node:
             print 'Node creation in progress, skipping children finishing'
         else:
-            self.current_parent = self.current_parent.parent
+            finished_parent = self.current_parent
+            self.current_parent = finished_parent.parent
             if self.current_parent:
-                last_sibling = self.current_parent.children[-1]
-                # and the following for safety's sake we will descend
-                # through all of the younger siblings if they exist
-                while last_sibling.younger_sibling:
-                    last_sibling = last_sibling.younger_sibling
-                self.last_sibling = last_sibling
+                self.last_sibling = finished_parent
             else:
                 self.last_sibling = None
 
+    def Builder(self):
+        # a DocumentBuilder adding to this document
+        return DocumentBuilder(self)
+
+    # EVENTS -------------------------------------------------------------------
+
+    def ApplyEvents(self, events, keep_roots=True):
+        # this creates nodes from a stream of events of the form
+        # ('start', name, attributes), ('content', text) and ('end', name)
+        # (which is what the XMLExtractor generates) and yields every root
+        # node as soon as it is finished. A node that gets a start event
+        # before its own end event is frozen as a parent. If keep_roots is
+        # False the finished roots are not kept in self.nodes, so that only
+        # the root currently being built is held in memory (the indexes are
+        # then turned off too, as they would grow with the file)
+        stats = instrumentation.current
+        if stats:
+            return stats.Timed('build', self.applyEvents(measureEvents(events, stats), keep_roots))
+        return self.applyEvents(events, keep_roots)
+
+    def applyEvents(self, events, keep_roots):
+        node_open = False   # true while a started node hasn't been finished
+        depth = 0
+        if not keep_roots:
+            self.indexed = False
+            self.name_index = {}
+            self.attribute_index = {}
+        for event in events:
+            if event[0] == 'start':
+                if node_open:
+                    self.FinishNode(True)
+                if self.current_parent:
+                    self.CreateChild(event[1])
+                else:
+                    self.CreateNode(event[1])
+                if event[2]:
+                    self.AddAttributes(**event[2])
+                node_open = True
+                depth = depth + 1
+            elif event[0] == 'content':
+                self.AddContent(event[1])
+            else:
+                if node_open:
+                    self.FinishNode()
+                    node_open = False
+                else:
+                    self.FinishChildren()
+                depth = depth - 1
+                if depth == 0:
+                    root = self.nodes[-1]
+                    if not keep_roots:
+                        self.nodes.pop()
+                        self.last_sibling = None
+                        root = self.detachRoot(root)
+                    yield root
+
+    def detachRoot(self, root):
+        # a root streamed away by ApplyEvents, holding on to nothing of the
+        # document. Nodes hold their subtree themselves, so this is the root
+        # (the CompactStructuredDocument moves it out of its arrays)
+        return root
+
+    def GenerateEvents(self):
+        # the opposite of ApplyEvents: yields the events that would build the
+        # document again, so it can be sent (or saved) as a flat list instead
+        # of a tree of nodes. Like the export it keeps a stack instead of
+        # calling itself for the children
+        for root in self.nodes:
+            stack = [iter([root])]
+            parents = []
+            while stack:
+                node = next(stack[-1], None)
+                if node is None:
+                    stack.pop()
+                    if parents:
+                        yield ('end', parents.pop().name)
+                    continue
+                yield ('start', node.name, dict(node.attributes))
+                if node.content is not None:
+                    yield ('content', node.content)
+                parents.append(node)
+                stack.append(iter(node.children))
+
+    # QUERIES ------------------------------------------------------------------
+
+    def indexNode(self, node):
+        if self.indexed:
+            self.addToIndex(self.name_index, node.name, node)
+
+    def indexAttributes(self, attributes):
+        # indexes the attributes just added to the current node
+        if self.indexed and self.index_attributes:
+            for key in attributes:
+                self.addToIndex(self.attribute_index, (key, unquote(attributes[key])), self.current_node)
+
+    def addToIndex(self, index, key, node):
+        entries = index.get(key)
+        if entries is None:
+            entries = self.newEntries()
+            index[key] = entries
+        entry = self.entryOf(node)
+        if not entries or entries[-1] != entry:    # attributes may be added twice
+            entries.append(entry)
+
+    # what the indexes keep for a node (the CompactStructuredDocument keeps
+    # node indexes in arrays instead)
+    def newEntries(self):
+        return []
+
+    def entryOf(self, node):
+        return node
+
+    def nodeOf(self, entry):
+        return entry
+
+    def Find(self, node_name=None, **attributes):
+        # returns the first node (in document order) with the name and
+        # attributes given, or None. Attribute values match with or without
+        # their quotes
+        for node in self.matches(node_name, attributes):
+            return node
+        return None
+
+    def FindAll(self, node_name=None, **attributes):
+        # returns a list of every node with the name and attributes given
+        return list(self.matches(node_name, attributes))
+
+    def matches(self, node_name, attributes):
+        # we go through the shortest list of candidates the indexes give us
+        # (nodes are created in document order, so the lists are in it too)
+        # and only walk the document if there is no index to use
+        candidates = None
+        if self.indexed:
+            if node_name is not None:
+                candidates = self.name_index.get(node_name, ())
+            if self.index_attributes:
+                for key in attributes:
+                    entries = self.attribute_index.get((key, unquote(attributes[key])), ())
+                    if candidates is None or len(entries) < len(candidates):
+                        candidates = entries
+        if candidates is None:
+            nodes = self.PreOrder()
+        else:
+            nodes = [self.nodeOf(entry) for entry in candidates]
+        for node in nodes:
+            if nodeMatches(node, node_name, attributes):
+                yield node
+
+    def PreOrder(self, node=None, prune=None):
+        # yields node and everything below it (or every node of the document
+        # if node is None), each parent before its children. prune is an
+        # optional function of a node returning True if the nodes below it
+        # should be skipped
+        if node is None:
+            stack = list(reversed(self.nodes))
+        else:
+            stack = [node]
+        while stack:
+            node = stack.pop()
+            yield node
+            if prune is None or not prune(node):
+                children = node.children
+                if children:
+                    stack.extend(reversed(children))
+
+    def PostOrder(self, node=None, prune=None):
+        # the same, but each parent after its children
+        if node is None:
+            stack = [(root, False) for root in reversed(self.nodes)]
+        else:
+            stack = [(node, False)]
+        while stack:
+            node, expanded = stack.pop()
+            if not expanded and (prune is None or not prune(node)):
+                children = node.children
+                if children:
+                    stack.append((node, True))
+                    stack.extend([(child, False) for child in reversed(children)])
+                    continue
+            yield node
+
     # EXPORT -------------------------------------------------------------------
 
     def CreateExport(self):
         # this will run through the various nodes (in order) and export each
         # with its children
-        export = ''
+        return ''.join(self.GenerateExport())
+
+    def GenerateExport(self):
+        # this yields the export piece by piece so that it can be written out
+        # without ever building the whole string
+        stats = instrumentation.current
+        if stats:
+            return stats.Timed('export', self.generateExport())
+        return self.generateExport()
+
+    def generateExport(self):
         for node in self.nodes:
-            export = export + self.CreateNodeExport(node)
-        return export
+            for piece in self.generateNodeExport(node):
+                yield piece
 
     def CreateNodeExport(self, node):
-        # this will first call itself on all of the nodes children, then will
-        # put markup tags with the node name in those tags around the node
-        # content and the results of its children's export
-        children_export = ''
-        if len(node.children) > 0:
-            for child in node.children:
-                children_export = children_export + self.CreateNodeExport(child)
-
-        # next we need to get the string of attributes in the form key="value"
-        attributes_export = ''
-        for key in node.attributes:
-            attributes_export = attributes_export + ' ' + writeValue(key) + '="' + writeValue(node.attributes[key]) + '"'
-		# now we put everything together
-        if children_export == '':
-            export = '<' + node.name + attributes_export + '>' + writeValue(node.content) + '</' + node.name + '>\n'
-        else:
-            export = '<' + node.name + attributes_export + '>' + '\n' + writeValue(node.content) + '\n' + children_export + '</' + node.name + '>\n'
-        return export
+        # this puts markup tags with the node name around the node content
+        # and the export of its children
+        return ''.join(self.generateNodeExport(node))
+
+    def generateNodeExport(self, node):
+        # this yields the export of a node and its descendants. Rather than
+        # calling itself on each child (which breaks on deep documents) it
+        # keeps a stack of the nodes whose children are being exported, each
+        # with an iterator over the children that are left
+        stack = []
+        while node:
+            start = '<' + node.name + self.attributesExport(node) + '>'
+            if node.children:
+                yield start + '\n' + writeValue(node.content) + '\n'
+                stack.append((node, iter(node.children)))
+            else:
+                yield start + writeValue(node.content) + '</' + node.name + '>\n'
+            node = None
+            while stack and not node:
+                node = next(stack[-1][1], None)
+                if not node:
+                    # all of the children are done so we close the parent
+                    yield '</' + stack.pop()[0].name + '>\n'
+
+    def attributesExport(self, node):
+        # the string of attributes in the form key="value"
+        return ''.join([' ' + writeValue(key) + '="' + writeValue(node.attributes[key]) + '"' for key in node.attributes])
+
+    def WriteExport(self, file):
+        # this writes the export into an open file object as it is generated
+        for piece in self.GenerateExport():
+            file.write(piece.encode('utf-8'))
 
     def Export(self, file_name):
         # this simply exports into the directory initially specified in __init__
         # into a file named through a passed argument
-        export = self.CreateExport().encode('utf-8')
         file = open(self.directory + '/' + file_name, 'wb')
-        file.write(export)
+        self.WriteExport(file)
+        file.close()
+
+    """
+    The JSON export turns the root nodes into Solr documents (see
+    solrDocuments below) for Solr's JSON update handlers. By default it is
+    a single JSON array, which /update takes, and with lines it is one
+    document per line, which /update/json/docs takes and which can be split
+    into batches anywhere between lines. Either way it is generated one
+    document at a time, so it can be written to a file (or a socket, through
+    socket.makefile) without building the whole string.
+    """
+    def GenerateJSON(self, lines=False):
+        first = True
+        if not lines:
+            yield '['
+        for node in self.nodes:
+            for document in solrDocuments(node):
+                text = json.dumps(document, ensure_ascii=False, separators=(',', ':'))
+                if lines:
+                    yield text + '\n'
+                elif first:
+                    yield text
+                else:
+                    yield ',\n' + text
+                first = False
+        if not lines:
+            yield ']\n'
+
+    def CreateJSON(self, lines=False):
+        return u''.join(self.GenerateJSON(lines))
+
+    def WriteJSON(self, file, lines=False):
+        for piece in self.GenerateJSON(lines):
+            if isinstance(piece, unicode):
+                piece = piece.encode('utf-8')
+            file.write(piece)
+
+    def ExportJSON(self, file_name, lines=False):
+        # like Export, but the Solr JSON
+        file = open(self.directory + '/' + file_name, 'wb')
+        self.WriteJSON(file, lines)
         file.close()
 
     # END ----------------------------------------------------------------------
 
+class CompactNode(object):
+    """
+    This is a lightweight view of a node kept in a CompactStructuredDocument.
+    It holds nothing but the document and the index of the node, and reads
+    name, content, attributes, parent, children and siblings from the
+    document's arrays, so it can be used wherever a DocumentNode is read.
+    Note the attributes dictionary is rebuilt on every access, so changing
+    it does not change the node (use AddAttributes for that)
+    """
+    __slots__ = ('document', 'index')
+
+    def __init__(self, document, index):
+        self.document = document
+        self.index = index
+
+    def __eq__(self, other):
+        return isinstance(other, CompactNode) and other.document is self.document and other.index == self.index
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return hash((id(self.document), self.index))
+
+    @property
+    def name(self):
+        return self.document.names[self.document.name_ids[self.index]]
+
+    @property
+    def content(self):
+        return decodeContent(self.document.contents[self.index])
+
+    @property
+    def attributes(self):
+        pairs = self.document.attribute_pairs[self.index]
+        if not pairs:
+            return {}
+        names = self.document.names
+        return dict([(names[key_id], value) for key_id, value in pairs])
+
+    @property
+    def parent(self):
+        return self.document.view(self.document.parents[self.index])
+
+    @property
+    def children(self):
+        children = []
+        child = self.document.first_children[self.index]
+        while child != -1:
+            children.append(CompactNode(self.document, child))
+            child = self.document.next_siblings[child]
+        return children
+
+    @property
+    def older_sibling(self):
+        # we only keep links to younger siblings, so we look for the child
+        # of our parent that links to us
+        parent = self.document.parents[self.index]
+        if parent == -1:
+            return None
+        sibling = self.document.first_children[parent]
+        older = -1
+        while sibling != self.index:
+            older = sibling
+            sibling = self.document.next_siblings[sibling]
+        return self.document.view(older)
+
+    @property
+    def younger_sibling(self):
+        return self.document.view(self.document.next_siblings[self.index])
+
+class CompactStructuredDocument(StructuredDocument):
+    """
+    This is a StructuredDocument that keeps its nodes in parallel arrays
+    instead of DocumentNode objects. Node i has its name id, parent, first
+    child and next sibling at position i of the arrays below (-1 meaning
+    there is none), its content at position i of contents and its attributes
+    as a tuple of (name id, value) pairs at position i of attribute_pairs.
+    Tag names and attribute keys are interned in the names list.
+
+    Creation works exactly as for the StructuredDocument, the only difference
+    being that current_node, current_parent, last_sibling and the root nodes
+    are CompactNode views. Those views are the only objects created per node
+    and only while they are in use, so big documents take a fraction of
+    the memory. The indexes used by Find and FindAll hold node indexes in
+    arrays too.
+
+    When ApplyEvents streams the roots away, each finished root is moved
+    (see detachRoot) into a document of its own that holds just its
+    subtree, so the arrays here only ever hold the root being built.
+    """
+    link_arrays = ('parents', 'first_children', 'next_siblings')
+    node_arrays = ('name_ids', 'contents', 'attribute_pairs') + link_arrays
+
+    def __init__(self, directory='', index_attributes=False):
+        StructuredDocument.__init__(self, directory, index_attributes)
+        self.names = []
+        self.name_table = {}    # name -> index in names
+        self.name_ids = array('i')
+        self.parents = array('i')
+        self.first_children = array('i')
+        self.next_siblings = array('i')
+        self.contents = []
+        self.attribute_pairs = []
+
+    def view(self, index):
+        # the view of a node index, or None for -1
+        if index == -1:
+            return None
+        return CompactNode(self, index)
+
+    # the indexes keep node indexes
+    def newEntries(self):
+        return array('i')
+
+    def entryOf(self, node):
+        return node.index
+
+    def nodeOf(self, entry):
+        return CompactNode(self, entry)
+
+    def intern(self, name):
+        name_id = self.name_table.get(name)
+        if name_id is None:
+            name_id = len(self.names)
+            self.names.append(name)
+            self.name_table[name] = name_id
+        return name_id
+
+    def newNode(self, node_name, parent=-1):
+        index = len(self.name_ids)
+        self.name_ids.append(self.intern(node_name))
+        self.parents.append(parent)
+        self.first_children.append(-1)
+        self.next_siblings.append(-1)
+        self.contents.append(None)
+        self.attribute_pairs.append(None)
+        return CompactNode(self, index)
+
+    def detachRoot(self, root):
+        # as the nodes are created depth first, the root's subtree is the end
+        # of the arrays. That end moves into a document of its own (sharing
+        # the names), the links in it shifted to start at 0, and is cut from
+        # ours. When the root is the first node, as it is while streaming,
+        # the arrays are simply handed over
+        start = root.index
+        detached = CompactStructuredDocument(self.directory)
+        detached.indexed = False
+        detached.names = self.names
+        detached.name_table = self.name_table
+        for name in self.node_arrays:
+            values = getattr(self, name)
+            if start == 0:
+                setattr(detached, name, values)
+                setattr(self, name, values[:0])
+            else:
+                setattr(detached, name, values[start:])
+                del values[start:]
+        if start:
+            for name in self.link_arrays:
+                links = getattr(detached, name)
+                for i in xrange(len(links)):
+                    if links[i] != -1:
+                        links[i] = links[i] - start
+        root = CompactNode(detached, 0)
+        detached.nodes.append(root)
+        return root
+
+    # CREATION -----------------------------------------------------------------
+
+    def CreateNode(self, node_name):
+        if self.ReadyForAction():
+            self.current_node = self.newNode(node_name)
+            self.indexNode(self.current_node)
+
+    def AddContent(self, content):
+        if self.current_node:
+            self.contents[self.current_node.index] = content
+        else:
+            print "No node in process of creation, skipping content addition"
+
+    def AddAttributes(self, **attributes):
+        if self.current_node:
+            index = self.current_node.index
+            merged = dict(self.attribute_pairs[index] or ())
+            for key in attributes:
+                merged[self.intern(key)] = attributes[key]
+            self.attribute_pairs[index] = tuple(merged.items())
+            self.indexAttributes(attributes)
+        else:
+            print "No node in process of creation, skipping attributes addition"
+
+    def CreateChild(self, node_name):
+        if self.current_parent:
+            if self.ReadyForAction():
+                parent = self.current_parent.index
+                self.current_node = self.newNode(node_name, parent)
+                self.indexNode(self.current_node)
+                if self.last_sibling:
+                    self.next_siblings[self.last_sibling.index] = self.current_node.index
+                else:
+                    self.first_children[parent] = self.current_node.index
+        else:
+            print 'No parent set, skipping child creation'
+
+class StructureException(Exception):
+    def __init__(self, problem):
+        self.problem = problem
+    def __str__(self):
+        return 'ERROR: document building failed because of the problem: %s' % self.problem
+
+class DocumentBuilder:
+    """
+    This builds a StructuredDocument (or a CompactStructuredDocument) a node
+    at a time, in constant time per node, and raises a StructureException
+    when it is misused instead of printing and carrying on. It keeps the
+    nodes that are open for children on a stack (the last sibling of the
+    innermost one being the document's last_sibling), so nesting is a
+    matter of opening and closing nodes:
+
+    builder = document.Builder()
+    with builder.Element('ul', id='menu'):
+        builder.Node('li', 'first')
+        builder.Node('li', 'second')
+
+    Build adds a whole subtree in one call, given as nested tuples of the
+    form (name, content, attributes, children) where everything after the
+    name may be left out and children is any iterable (a generator too) of
+    more such tuples:
+
+    builder.Build(('ul', None, {'id': 'menu'}, [('li', 'first'), ('li', 'second')]))
+
+    (attributes called name or content can only be given that way). Don't
+    create nodes through the document itself while using a builder, the
+    builder will refuse to go on if it finds the document changed under it.
+    """
+
+    def __init__(self, document):
+        self.document = document
+        self.open = []  # the nodes open for children, innermost last
+
+    def checkState(self):
+        problem = self.stateProblem()
+        if problem:
+            raise StructureException(problem)
+
+    def stateProblem(self):
+        # why the builder can't go on with the document, or None if it can
+        document = self.document
+        if document.current_node:
+            return 'node %s is already in creation' % document.current_node.name
+        if self.open:
+            if document.current_parent != self.open[-1]:
+                return 'the document is no longer adding children to %s' % self.open[-1].name
+        elif document.current_parent:
+            return 'the document is adding children to %s, which the builder did not open' % document.current_parent.name
+        return None
+
+    def createNode(self, name, content, attributes):
+        self.checkState()
+        document = self.document
+        if self.open:
+            document.CreateChild(name)
+        else:
+            document.CreateNode(name)
+        node = document.current_node
+        if content is not None:
+            document.AddContent(content)
+        if attributes:
+            document.AddAttributes(**attributes)
+        return node
+
+    def Node(self, name, content=None, **attributes):
+        # adds a node without children under the open node (or as a root)
+        return self.addNode(name, content, attributes)
+
+    def Open(self, name, content=None, **attributes):
+        # adds a node and opens it, so the next nodes are its children
+        return self.openNode(name, content, attributes)
+
+    def addNode(self, name, content, attributes):
+        node = self.createNode(name, content, attributes)
+        self.document.FinishNode()
+        return node
+
+    def openNode(self, name, content, attributes):
+        node = self.createNode(name, content, attributes)
+        self.document.FinishNode(True)
+        self.open.append(node)
+        return node
+
+    def Close(self):
+        # closes the innermost open node and returns it
+        if not self.open:
+            raise StructureException('there is no open node to close')
+        self.checkState()
+        self.document.FinishChildren()
+        return self.open.pop()
+
+    @contextlib.contextmanager
+    def Element(self, name, content=None, **attributes):
+        # opens a node for the block and closes it afterwards. If the block
+        # raised, the node is only closed if the builder is in a state to,
+        # so that the error of the block is the one that comes through
+        node = self.Open(name, content, **attributes)
+        try:
+            yield node
+        except:
+            if self.open and self.open[-1] == node and not self.stateProblem():
+                self.Close()
+            raise
+        self.Close()
+
+    def Build(self, tree):
+        # adds the subtree tree under the open node (or as a root) and
+        # returns its top node. The children still to add are kept on a
+        # stack instead of calling ourselves, so it works however deep
+        # the tree is
+        name, content, attributes, children = unpackTree(tree)
+        if children is None:
+            return self.addNode(name, content, attributes)
+        top = self.openNode(name, content, attributes)
+        pending = [iter(children)]
+        finished = object()     # so that a child that is None is an error
+        while pending:
+            child = next(pending[-1], finished)
+            if child is finished:
+                pending.pop()
+                self.Close()
+                continue
+            name, content, attributes, children = unpackTree(child)
+            if children is None:
+                self.addNode(name, content, attributes)
+            else:
+                self.openNode(name, content, attributes)
+                pending.append(iter(children))
+        return top
+
+def unpackTree(tree):
+    # the name, content, attributes and children (None if it has none given)
+    # of a (name, content, attributes, children) tuple
+    if not isinstance(tree, (tuple, list)) or not 1 <= len(tree) <= 4:
+        raise StructureException('%r is not a (name, content, attributes, children) tuple' % (tree,))
+    if not isinstance(tree[0], basestring):
+        raise StructureException('%r is not a node name' % (tree[0],))
+    tree = tuple(tree) + (None,) * (4 - len(tree))
+    return tree[0], tree[1], tree[2] or {}, tree[3]
+
+def solrDocuments(node):
+    # yields the Solr documents (dictionaries of field name -> value) of a
+    # root node. An add node (as in a Solr xml file) holds a document for
+    # each of its doc children, any other node is a document itself
+    if node.name == 'add':
+        for child in node.children:
+            if child.name == 'doc':
+                yield solrDocument(child)
+    else:
+        yield solrDocument(node)
+
+def solrDocument(node):
+    # the fields of a document are its attributes and its children:
+    # <field name="key">value</field>   key: value (as in a Solr xml file)
+    # <key>value</key>                  key: value
+    # a doc or a node with children     a child document
+    # A field found more than once gets a list of its values. A node without
+    # children or attributes becomes {name: content}. Fields keep the order
+    # they were found in. The attributes of a doc (such as boost) tell Solr
+    # how to index it, so they are not fields. Names and values are unicode
+    document = collections.OrderedDict()
+    child_documents = []
+    if node.name != 'doc':
+        for key in node.attributes:
+            addValue(document, toText(key), toText(unquote(node.attributes[key])))
+    for child in node.children:
+        if child.name == 'field' and 'name' in child.attributes:
+            addValue(document, toText(unquote(child.attributes['name'])), toText(child.content) or u'')
+        elif child.name == 'doc' or child.children:
+            child_documents.append(solrDocument(child))
+        elif child.content is not None:
+            addValue(document, toText(child.name), toText(child.content))
+    if child_documents:
+        document['_childDocuments_'] = child_documents
+    if not document and node.content is not None:
+        document[toText(node.name)] = toText(node.content)
+    return document
+
+def addValue(document, key, value):
+    if key not in document:
+        document[key] = value
+    elif isinstance(document[key], list):
+        document[key].append(value)
+    else:
+        document[key] = [document[key], value]
+
+def measureEvents(events, stats):
+    # yields the events, counting the nodes they create and how deep they go
+    depth = 0
+    deepest = 0
+    created = 0
+    try:
+        for event in events:
+            if event[0] == 'start':
+                created = created + 1
+                depth = depth + 1
+                if depth > deepest:
+                    deepest = depth
+            elif event[0] == 'end':
+                depth = depth - 1
+            yield event
+    finally:
+        stats.Count('nodes created', created)
+        stats.Maximum('max depth', deepest)
+
+def toText(value):
+    # names and attribute values read from a file are utf-8 strings, while
+    # content is already unicode
+    if isinstance(value, str):
+        return value.decode('utf-8')
+    return value
+
 def writeValue(value):
 	# this just keeps us from writing None when our value doesn't exist
 	if value:
@@ -201,6 +937,99 @@ def writeValue(value):
 	else:
 		return ''
 
+def unquote(value):
+    # attribute values keep their quotes when read from a file
+    if value and len(value) > 1 and value[0] in '"\'' and value[-1] == value[0]:
+        return value[1:-1]
+    return value
+
+def nodeMatches(node, node_name, attributes):
+    if node_name is not None and node.name != node_name:
+        return False
+    if attributes:
+        node_attributes = node.attributes
+        for key in attributes:
+            if key not in node_attributes or unquote(node_attributes[key]) != unquote(attributes[key]):
+                return False
+    return True
+
+def ruleName(node, encoding):
+    # how the rule of an extractor (the node it was added for) is named in
+    # the stats: its tag name and attributes, as in div class="content"
+    attributes = normalizeAttributes(node.attributes, encoding)
+    return ' '.join([node.name] + ['%s="%s"' % (key, attributes[key]) for key in sorted(attributes)])
+
+def normalizeAttributes(attributes, encoding):
+    # returns the attributes with keys and values as encoded strings, which
+    # is how tags and nodes are compared
+    normalized = {}
+    for key in attributes:
+        normalized[key.encode(encoding)] = writeValue(attributes[key]).encode(encoding)
+    return normalized
+
+class ExtractorSet(list):
+    """
+    The extractor added for a rule followed by its arguments, called as
+    extractor_set[0](tag, *extractor_set[1:]), which also carries the name
+    of the rule (see ruleName) so the stats can tell which rule matched
+    """
+    __slots__ = ('rule',)
+
+    def __init__(self, values, rule):
+        list.__init__(self, values)
+        self.rule = rule
+
+class ExtractorIndex:
+    """
+    This holds representative nodes (each with a value) so that we can find
+    the one that best soft compares to a tag without comparing the tag to all
+    of them. Nodes are put in buckets by name and their attributes are
+    normalized once when they are added. The best match is the node with the
+    most attributes that all match the tag, the first added winning a tie,
+    exactly as in HTMLExtractor.getExtractor. The result is cached for every
+    tag signature (the name and normalized attributes of the tag).
+    """
+    CACHE_SIZE = 10000  # signatures remembered before the cache is cleared
+
+    def __init__(self, encoding='utf-8'):
+        self.encoding = encoding
+        self.buckets = {}   # name -> list of (attribute items, value)
+        self.cache = {}
+
+    def Add(self, node, value):
+        attributes = normalizeAttributes(node.attributes, self.encoding)
+        if node.name not in self.buckets:
+            self.buckets[node.name] = []
+        self.buckets[node.name].append((attributes.items(), value))
+        self.cache = {}
+
+    def Match(self, tag):
+        # returns the value of the best matching node or None
+        if isinstance(tag, str):
+            return None
+        bucket = self.buckets.get(tag.name)
+        if not bucket:
+            return None
+        tag_attributes = normalizeAttributes(tag.attrs, self.encoding)
+        signature = (tag.name, tuple(sorted(tag_attributes.items())))
+        if signature in self.cache:
+            return self.cache[signature]
+        match = None
+        current_match_number = -1
+        for items, value in bucket:
+            if len(items) <= current_match_number:
+                continue
+            for key, node_value in items:
+                if tag_attributes.get(key) != node_value:
+                    break
+            else:
+                match = value
+                current_match_number = len(items)
+        if len(self.cache) >= self.CACHE_SIZE:
+            self.cache = {}
+        self.cache[signature] = match
+        return match
+
 class HTMLExtractor:
     """
     This class will be used to extract the various bits and pieces we might
@@ -226,12 +1055,21 @@ class HTMLExtractor:
     But all you need to input is the directory to save the file to, the soup
     you want to parse, and then you must initialize the extractor. Then call Extract
     and you have your document!
+
+    Instead of a soup you can also give AddStream the html itself (an open
+    file or a string). ExtractHTML then reads it as a stream of events with
+    an HTMLEventExtractor (see below) and applies the same extractors to it,
+    without ever building a tree of the page.
     """
+    CHUNK_SIZE = 64 * 1024  # characters read at a time from a stream
 
     def __init__(self, directory):
         self.directory = directory
         self.ENCODING = 'utf-8'
         self.extractors = {}
+        self.extractor_index = None # compiled from extractors by getExtractor
+        self.soup = None
+        self.stream = None
         self.initializeState() # useful for store and retrieving state data in extractors
         # these are key value pairs, where the key
         # is a node and the value is a function
@@ -244,15 +1082,26 @@ class HTMLExtractor:
     def AddSoup(self, soup):
         # this allows us to initialize and then reuse this object
         self.soup = soup
+        self.stream = None
         # we also have to start a new document
         self.document = StructuredDocument(self.directory)
 
+    def AddStream(self, stream):
+        # the same as AddSoup but for html that hasn't been parsed, an open
+        # file or a string (encoded in self.ENCODING unless it is unicode)
+        self.soup = None
+        self.stream = stream
+        self.document = StructuredDocument(self.directory)
+
     def AddExtractor(self, node, extractor, *args):
         # this allows us to tell our HTML extractor what to do with a tag that
         # soft compares to node
-        value = [extractor]
-        value.extend(args)
+        value = ExtractorSet([extractor] + list(args), ruleName(node, self.ENCODING))
+        if getattr(extractor, 'im_func', None) is HTMLExtractor.rollingExtractor.im_func and len(value) > 2:
+            # the end nodes of a rolling extractor are compiled once, here
+            value[2] = self.endIndex(value[2])
         self.extractors[node] = value
+        self.extractor_index = None # has to be compiled again
 
     def ExtractHTML(self):
         # here all we do is start with the top element and roll our way
@@ -260,7 +1109,43 @@ class HTMLExtractor:
         # we will need to define an extractor that causes us to get the
         # children note we start with the HTML and don't concern ourselves
         # with the metadata, this can be changed
-        self.extractChildren(self.soup.html)
+        if self.stream is not None:
+            self.extractStream()
+            return
+        stats = instrumentation.current
+        if not stats:
+            self.extractChildren(self.soup.html)
+            return
+        # every extract goes through measuredExtract while we are collecting
+        self.extract = self.measuredExtract
+        try:
+            self.extractChildren(self.soup.html)
+        finally:
+            del self.extract
+
+    def extractStream(self):
+        event_extractor = HTMLEventExtractor(self)
+        if isinstance(self.stream, basestring):
+            chunks = [self.stream]
+        else:
+            chunks = iter(lambda: self.stream.read(self.CHUNK_SIZE), '')
+        decoder = codecs.getincrementaldecoder(self.ENCODING)('replace')
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = decoder.decode(chunk)
+            event_extractor.feed(chunk)
+        event_extractor.feed(decoder.decode('', True))
+        event_extractor.close()
+
+    def measuredExtract(self, tag):
+        # extract, counting and timing the extractor that handles the tag
+        stats = instrumentation.current
+        extractor_set = self.getExtractor(tag)
+        rule = self.ruleOf(extractor_set)
+        stats.Count('dispatches')
+        stats.Count('dispatch ' + rule)
+        with stats.Time('extractor ' + rule):
+            return extractor_set[0](tag, *extractor_set[1:])
 
     def extract(self, tag):
         extractor_set = self.getExtractor(tag)
@@ -317,15 +1202,7 @@ class HTMLExtractor:
         # the child elements here.
         # start_tag should be bs tag and child_tags and end_tags should be
         # document nodes with attributes and a name
-        tag_name = start_tag.get_text()
-        # note we need to default to making a child in order to nest this
-        # function
-        if self.document.current_parent:
-            self.document.CreateChild(tag_name)
-        else:
-            self.document.CreateNode(tag_name)
-        # now we finish it and set it as the current parent
-        self.document.FinishNode(True)
+        self.startRolling(start_tag.get_text())
 
         # next we are going to go through the siblings until we find a stopping
         # tag
@@ -334,18 +1211,23 @@ class HTMLExtractor:
         except:
             next_sibling = None
         while next_sibling:
-            is_stopper = False
-            for end_node in end_nodes:
-                if self.softCompare(next_sibling, end_node):
-                    is_stopper = True
-                    break
-            if is_stopper:
+            if self.isStopper(next_sibling, end_nodes):
                 break
             next_sibling = self.extract(next_sibling)
         # now that we have ended we simply finish of the children
         self.document.FinishChildren()
         return next_sibling
 
+    def startRolling(self, tag_name):
+        # note we need to default to making a child in order to nest this
+        # function
+        if self.document.current_parent:
+            self.document.CreateChild(tag_name)
+        else:
+            self.document.CreateNode(tag_name)
+        # now we finish it and set it as the current parent
+        self.document.FinishNode(True)
+
     def softCompare(self, tag, node):
         # 2. I realized that this used in getExtractor will just give the first
         # soft match and not the best, so I am going to allow this to be a bit
@@ -363,12 +1245,8 @@ class HTMLExtractor:
         # now we can treat it as a tag
         if not tag.name == node.name:
             return (False, 0)
-        tag_attributes = {}
-        for key in tag.attrs:
-            tag_attributes[key.encode(self.ENCODING)] = writeValue(tag.attrs[key]).encode(self.ENCODING)
-        node_attributes = {}
-        for key in node.attributes:
-            node_attributes[key.encode(self.ENCODING)] = writeValue(node.attributes[key]).encode(self.ENCODING)
+        tag_attributes = normalizeAttributes(tag.attrs, self.ENCODING)
+        node_attributes = normalizeAttributes(node.attributes, self.ENCODING)
 
         for key in node_attributes:
             if key in tag_attributes:
@@ -380,16 +1258,289 @@ class HTMLExtractor:
         return (True, len(node_attributes))
 
     def getExtractor(self, tag):
+        # 3. the extractors are compiled into an ExtractorIndex (when they
+        # have changed) so we only compare against nodes with the tag's name
         # 2. updating for more explicit softCompare
         # 1. this will retrieve the extractor for the tag we have
-        extractor = [self.noAction]
-        current_match_number = -1   # some nodes won't have attributes
-        for node in self.extractors:
-            compare = self.softCompare(tag, node)
-            if compare[0] == True and compare[1] > current_match_number:
-                extractor = self.extractors[node]
-                current_match_number = compare[1]
-        return extractor
+        if not self.extractor_index:
+            self.extractor_index = ExtractorIndex(self.ENCODING)
+            for node in self.extractors:
+                self.extractor_index.Add(node, self.extractors[node])
+        extractor = self.extractor_index.Match(tag)
+        if extractor:
+            return extractor
+        return [self.noAction]
+
+    def ruleOf(self, extractor_set):
+        # the name of the rule getExtractor found extractor_set for (its tag
+        # name and attributes), or noAction if no rule matched
+        return getattr(extractor_set, 'rule', 'noAction')
+
+    def isStopper(self, tag, end_nodes):
+        # this checks tag against the end nodes of a rolling extractor, which
+        # AddExtractor has compiled into an ExtractorIndex (a list of nodes
+        # passed in some other way is compiled for this call only)
+        if not isinstance(end_nodes, ExtractorIndex):
+            end_nodes = self.endIndex(end_nodes)
+        return end_nodes.Match(tag) == True
+
+    def endIndex(self, end_nodes):
+        end_index = ExtractorIndex(self.ENCODING)
+        for end_node in end_nodes:
+            end_index.Add(end_node, True)
+        return end_index
 
     def noAction(self, tag):
         return tag.next_sibling
+
+# STREAMED HTML ----------------------------------------------------------------
+
+VOID_ELEMENTS = set(['area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input',
+    'keygen', 'link', 'meta', 'param', 'source', 'track', 'wbr'])
+    # elements that never have an end tag
+MULTI_VALUED_ATTRIBUTES = set(['class', 'rel', 'rev', 'accept-charset', 'headers',
+    'accesskey', 'dropzone'])
+    # attributes BeautifulSoup splits into lists of values
+
+class StreamString(unicode):
+    """
+    This is text within a StreamTag. Like a NavigableString it has no name
+    and knows its next sibling, so no extractor matches it
+    """
+    name = None
+    next_sibling = None
+
+class StreamTag(object):
+    """
+    This is an element read from the stream, with what the extractors use of
+    a BeautifulSoup tag: name, attrs, contents, children, next_sibling and
+    get_text. Its contents are only read for the extractors that need them
+    (see HTMLEventExtractor)
+    """
+
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = attrs
+        self.contents = []
+        self.next_sibling = None
+
+    @property
+    def children(self):
+        return iter(self.contents)
+
+    def append(self, child):
+        if self.contents:
+            self.contents[-1].next_sibling = child
+        self.contents.append(child)
+
+    def get_text(self):
+        pieces = []
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, StreamTag):
+                stack.extend(reversed(node.contents))
+            else:
+                pieces.append(node)
+        return u''.join(pieces)
+
+# what an open element is doing with what is inside it
+DISPATCH = 0    # its child elements are extracted (the children extractor)
+SKIP = 1        # nothing (no action)
+TEXT = 2        # its text is read (title, plain text and the start of rolling)
+TREE = 3        # all of it is read into a StreamTag (any other extractor)
+INSIDE = 4      # it is within an element that is reading its text or tree
+
+class OpenElement(object):
+    __slots__ = ('name', 'mode', 'extractor_set', 'tag', 'pieces', 'rollings')
+
+    def __init__(self, name, mode, extractor_set=None, tag=None):
+        self.name = name
+        self.mode = mode
+        self.extractor_set = extractor_set
+        self.tag = tag
+        self.pieces = None      # the text read so far in TEXT mode
+        self.rollings = None    # the end nodes of the rolling extractors going on among the children
+
+class HTMLEventExtractor(HTMLParser.HTMLParser):
+    """
+    This applies the extractors of an HTMLExtractor to html as it is parsed,
+    instead of to a soup. What an extractor does is decided when the start
+    tag of an element is read (that is all that soft comparing needs) and
+    then carried out on the events inside the element:
+    extractChildren     its child elements are extracted in turn
+    noAction            everything inside it is skipped
+    titleExtractor,     its text is read, and at its end tag the extractor
+    plainTextExtractor  is given a StreamTag holding just that text
+    rollingExtractor    its text is read and at its end tag the node for it
+                        is started. The elements after it are then extracted
+                        as children of that node until one compares to an
+                        end node or their parent ends, just as the rolling
+                        extractor does with next_sibling
+    anything else       the element is read into a StreamTag (with its
+                        children) that the extractor is given at the end tag
+    Extraction starts with the children of the html element (or with the
+    elements at the top, if there is no html element).
+
+    We only keep the elements that are open, plus the text (or the tree) of
+    the element being read, so memory doesn't grow with the page. Void
+    elements (br, img and so on) are closed right away, an end tag closes
+    every element opened after its own start tag and an end tag without a
+    start tag is ignored. Attributes in MULTI_VALUED_ATTRIBUTES are split
+    into lists, as BeautifulSoup does, so the extractors compare the same.
+    An extractor other than the built in ones only ever sees the element
+    it was given, it can't roll on into the elements after it.
+    """
+
+    def __init__(self, html_extractor):
+        HTMLParser.HTMLParser.__init__(self)
+        self.html_extractor = html_extractor
+        self.document = html_extractor.document
+        self.stats = instrumentation.current
+        self.position = 0   # where the reference being handled starts in rawdata (see updatepos)
+        self.open = [OpenElement(None, DISPATCH)]   # the top of the page at the bottom
+        self.reader = None  # the element whose text or tree is being read
+        self.modes = {}     # function -> mode, for the built in extractors
+        for function, mode in [(HTMLExtractor.extractChildren, DISPATCH), (HTMLExtractor.noAction, SKIP),
+                (HTMLExtractor.titleExtractor, TEXT), (HTMLExtractor.plainTextExtractor, TEXT),
+                (HTMLExtractor.rollingExtractor, TEXT)]:
+            self.modes[function.im_func] = mode
+
+    def handle_starttag(self, name, attributes):
+        self.start(name, streamAttributes(attributes))
+        if name in VOID_ELEMENTS:
+            self.finish(self.open.pop())
+
+    def handle_startendtag(self, name, attributes):
+        self.start(name, streamAttributes(attributes))
+        self.finish(self.open.pop())
+
+    def handle_endtag(self, name):
+        if name in VOID_ELEMENTS:
+            return
+        for position in range(len(self.open) - 1, 0, -1):
+            if self.open[position].name == name:
+                while len(self.open) > position:
+                    self.finish(self.open.pop())
+                return
+
+    def handle_data(self, data):
+        reader = self.reader
+        if reader is None:
+            return
+        if reader.mode == TEXT:
+            reader.pieces.append(data)
+        else:
+            self.open[-1].tag.append(StreamString(data))
+
+    def handle_entityref(self, name):
+        if name in htmlentitydefs.name2codepoint:
+            self.handle_data(unichr(htmlentitydefs.name2codepoint[name]))
+        else:
+            self.handle_data(self.writtenReference('&', name))
+
+    def handle_charref(self, name):
+        try:
+            if name[:1] in 'xX':
+                character = unichr(int(name[1:], 16))
+            else:
+                character = unichr(int(name))
+        except ValueError:
+            character = self.writtenReference('&#', name)
+        self.handle_data(character)
+
+    def updatepos(self, i, j):
+        # the parser moves up to every reference before handling it, so this
+        # keeps where the reference being handled starts in rawdata
+        self.position = j
+        return HTMLParser.HTMLParser.updatepos(self, i, j)
+
+    def writtenReference(self, prefix, name):
+        # a reference we can't decode, as it was written in the page. The
+        # parser gives us only its name, whether or not a ; ended it
+        start = self.position
+        end = start + len(prefix) + len(name)
+        if self.rawdata[end:end + 1] == ';':
+            end = end + 1
+        return self.rawdata[start:end]
+
+    def close(self):
+        HTMLParser.HTMLParser.close(self)
+        while self.open:
+            self.finish(self.open.pop())
+
+    def start(self, name, attributes):
+        parent = self.open[-1]
+        if parent.mode == SKIP:
+            self.open.append(OpenElement(name, SKIP))
+            return
+        if parent.mode != DISPATCH:
+            # within an element being read
+            element = OpenElement(name, INSIDE)
+            if self.reader.mode == TREE:
+                element.tag = StreamTag(name, attributes)
+                parent.tag.append(element.tag)
+            self.open.append(element)
+            return
+        if name == 'html' and len(self.open) == 1:
+            self.open.append(OpenElement(name, DISPATCH))
+            return
+        tag = StreamTag(name, attributes)
+        # a rolling extractor stops at the first element that is one of its
+        # end nodes, and that element is then extracted as usual
+        while parent.rollings and self.html_extractor.isStopper(tag, parent.rollings[-1]):
+            parent.rollings.pop()
+            self.document.FinishChildren()
+        extractor_set = self.html_extractor.getExtractor(tag)
+        function = getattr(extractor_set[0], 'im_func', None)
+        mode = self.modes.get(function, TREE)
+        if self.stats:
+            self.stats.Count('dispatches')
+            self.stats.Count('dispatch ' + self.html_extractor.ruleOf(extractor_set))
+        element = OpenElement(name, mode, extractor_set, tag)
+        if mode == TEXT:
+            element.pieces = []
+            self.reader = element
+        elif mode == TREE:
+            self.reader = element
+        self.open.append(element)
+
+    def finish(self, element):
+        # called once an element has ended (element is no longer open)
+        if element.rollings:
+            for end_nodes in element.rollings:
+                self.document.FinishChildren()
+        if element is not self.reader:
+            return
+        self.reader = None
+        extractor_set = element.extractor_set
+        if self.stats:
+            # timed as in HTMLExtractor.measuredExtract
+            with self.stats.Time('extractor ' + self.html_extractor.ruleOf(extractor_set)):
+                self.runExtractor(element, extractor_set)
+        else:
+            self.runExtractor(element, extractor_set)
+
+    def runExtractor(self, element, extractor_set):
+        if element.mode == TEXT:
+            text = u''.join(element.pieces)
+            if extractor_set[0].im_func is HTMLExtractor.rollingExtractor.im_func:
+                self.html_extractor.startRolling(text)
+                parent = self.open[-1]
+                if parent.rollings is None:
+                    parent.rollings = []
+                parent.rollings.append(extractor_set[2])
+                return
+            element.tag.append(StreamString(text))
+        extractor_set[0](element.tag, *extractor_set[1:])
+
+def streamAttributes(attributes):
+    # the attributes from HTMLParser as BeautifulSoup would give them
+    streamed = {}
+    for key, value in attributes:
+        if value is None:
+            value = u''
+        if key in MULTI_VALUED_ATTRIBUTES:
+            value = value.split()
+        streamed[key] = value
+    return streamed
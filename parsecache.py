@@ -0,0 +1,123 @@
+# Python File parsecache.py
+
+"""
+This holds a cache of parsed documents for XMLExtractors, so that the same
+file isn't parsed again and again (by FieldTrackers reading the same template
+or FieldExtractors reading the same fragments). Give the same ParseCache to
+every extractor that should share it.
+
+A file is identified by its path, size and modification time, and its
+contents by their sha1 hash (so the file is only read to hash it the first
+time we see that identity). Documents are kept in memory, least recently
+used first out, for as long as the files they were parsed from add up to no
+more than max_bytes. Note the documents take several times the size of their
+file in memory, and they are shared, so don't change them.
+
+If a directory is given, the parse events of every document are also saved
+there under its hash. Other processes (or the same job run again) using the
+same directory then only have to replay the events, which is much quicker
+than parsing. Events are saved to a temporary file first and then renamed,
+so a reader never sees half a file.
+"""
+
+import os
+import hashlib
+import tempfile
+import collections
+import cPickle
+
+MAX_BYTES = 64 * 1024 * 1024
+
+class ParseCache:
+
+    def __init__(self, max_bytes=MAX_BYTES, directory=None):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.entries = collections.OrderedDict()  # (hash, document class, single pass) -> (document, size)
+        self.hashes = {}    # (path, size, mtime) -> hash of the contents
+        self.bytes = 0
+        self.hits = 0       # documents found in memory
+        self.disk_hits = 0  # documents replayed from the directory
+        self.misses = 0     # documents we had to parse
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def Document(self, xml_extractor):
+        # returns the document for the file the extractor has been given
+        status = os.stat(xml_extractor.address)
+        identity = (os.path.abspath(xml_extractor.address), status.st_size, status.st_mtime)
+        contents = None
+        digest = self.hashes.get(identity)
+        if digest is None:
+            contents = xml_extractor.file.read()
+            digest = hashlib.sha1(contents).hexdigest()
+            self.hashes[identity] = digest
+        key = (digest, xml_extractor.document_class, xml_extractor.single_pass)
+        if key in self.entries:
+            self.hits = self.hits + 1
+            entry = self.entries.pop(key)
+            self.entries[key] = entry   # now the most recently used
+            return entry[0]
+        if xml_extractor.single_pass:
+            # the two scanners don't always agree, so their events are kept apart
+            digest = digest + '.single'
+        events = self.load(digest)
+        if events is None:
+            self.misses = self.misses + 1
+            if contents is None:
+                contents = xml_extractor.file.read()
+            events = list(xml_extractor.generateEvents(xml_extractor.scan([contents])))
+            self.save(digest, events)
+        else:
+            self.disk_hits = self.disk_hits + 1
+        document = xml_extractor.document_class(xml_extractor.directory)
+        for node in document.ApplyEvents(events):
+            pass
+        self.remember(key, document, status.st_size)
+        return document
+
+    def remember(self, key, document, size):
+        if size > self.max_bytes:
+            return
+        self.entries[key] = (document, size)
+        self.bytes = self.bytes + size
+        while self.bytes > self.max_bytes:
+            old_key, old_entry = self.entries.popitem(False)
+            self.bytes = self.bytes - old_entry[1]
+
+    def eventsAddress(self, digest):
+        return os.path.join(self.directory, digest + '.events')
+
+    def load(self, digest):
+        # the saved events for digest or None
+        if not self.directory:
+            return None
+        try:
+            file = open(self.eventsAddress(digest), 'rb')
+        except IOError:
+            return None
+        try:
+            return cPickle.load(file)
+        except (EOFError, cPickle.UnpicklingError):
+            return None
+        finally:
+            file.close()
+
+    def save(self, digest, events):
+        if not self.directory:
+            return
+        descriptor, temporary = tempfile.mkstemp(dir=self.directory)
+        file = os.fdopen(descriptor, 'wb')
+        cPickle.dump(events, file, cPickle.HIGHEST_PROTOCOL)
+        file.close()
+        os.rename(temporary, self.eventsAddress(digest))
+
+    def Stats(self):
+        return {'hits': self.hits, 'disk_hits': self.disk_hits, 'misses': self.misses,
+            'documents': len(self.entries), 'bytes': self.bytes}
+
+    def Clear(self):
+        # forgets the documents in memory (not the ones saved to disk)
+        self.entries.clear()
+        self.hashes.clear()
+        self.bytes = 0
@@ -0,0 +1,140 @@
+# Python File scrapepipeline.py
+
+"""
+This runs an HTMLExtractor over many pages at once with a process pool.
+Run it as:
+python scrapepipeline.py <module.factory> <html directory> <output directory> [processes]
+
+An HTMLExtractor holds the document it is building (and its state and
+soup), so one can only work on one page at a time. Here every worker of
+the pool makes its own extractor once, by calling factory, a function
+(importable at the top of a module, so the workers can find it) that
+returns an HTMLExtractor with its extractors added. The worker then reads
+each page it is given as a stream (see HTMLExtractor.AddStream) and sends
+the document back as the flat list of its events (StructuredDocument.
+GenerateEvents), which pickles quickly and without recursion however deep
+the document is. The documents are rebuilt here and handed to the writer,
+one at a time and in the order of the pages.
+
+A page is either the address of an html file (which is then also its key)
+or a (key, html) pair. Pages are only taken from the iterable as the
+workers get through them: at most window of them (4 per process by
+default) are given out and not yet written, so memory stays the same
+however many pages there are. A page that fails is reported as
+(key, problem) and doesn't stop the others.
+"""
+
+import os
+import sys
+import time
+import collections
+import multiprocessing
+from markupcreator import StructuredDocument
+from documentfiles import listDocuments
+
+PAGES_PER_PROCESS = 4   # pages given out per process at a time
+
+# set in each worker by initializeWorker
+worker_extractor = None
+
+def initializeWorker(factory):
+    global worker_extractor
+    worker_extractor = factory()
+
+def extractPage(page):
+    # returns the key of the page and the events of its document, or the key,
+    # None and the problem if it couldn't be extracted
+    if isinstance(page, basestring):
+        key = page
+    else:
+        key = page[0]
+    try:
+        if isinstance(page, basestring):
+            file = open(page, 'rb')
+            try:
+                worker_extractor.AddStream(file)
+                worker_extractor.initializeState()
+                worker_extractor.ExtractHTML()
+            finally:
+                file.close()
+        else:
+            worker_extractor.AddStream(page[1])
+            worker_extractor.initializeState()
+            worker_extractor.ExtractHTML()
+        return key, list(worker_extractor.document.GenerateEvents()), None
+    except Exception as exception:
+        return key, None, '%s: %s' % (exception.__class__.__name__, exception)
+
+def streamPages(pages, factory, processes=None, window=None, errors=None):
+    # yields (key, document) for every page in the order of pages. The pages
+    # that fail are appended to errors as (key, problem) if it is given
+    if not processes:
+        processes = multiprocessing.cpu_count()
+    if not window:
+        window = processes * PAGES_PER_PROCESS
+    pool = multiprocessing.Pool(processes, initializeWorker, (factory,))
+    pending = collections.deque()
+    try:
+        pages = iter(pages)
+        page = next(pages, None)
+        while page is not None or pending:
+            # give out pages until the window is full, then wait for the oldest
+            while page is not None and len(pending) < window:
+                pending.append(pool.apply_async(extractPage, (page,)))
+                page = next(pages, None)
+            key, events, problem = pending.popleft().get()
+            if problem:
+                if errors is not None:
+                    errors.append((key, problem))
+                continue
+            document = StructuredDocument()
+            for node in document.ApplyEvents(events):
+                pass
+            yield key, document
+    finally:
+        # every result is in (or the caller stopped reading early)
+        pool.terminate()
+        pool.join()
+
+def scrapePages(pages, factory, writer, processes=None, window=None):
+    # calls writer(key, document) for every page and returns the number
+    # written, a list of (key, problem) for the pages that failed and the
+    # seconds it took
+    start = time.time()
+    errors = []
+    written = 0
+    for key, document in streamPages(pages, factory, processes, window, errors):
+        writer(key, document)
+        written = written + 1
+    return written, errors, time.time() - start
+
+def exportWriter(output_directory):
+    # a writer that exports each document to output_directory under the
+    # name of its page
+    def writer(key, document):
+        file = open(os.path.join(output_directory, os.path.basename(key) + '.xml'), 'wb')
+        document.WriteExport(file)
+        file.close()
+    return writer
+
+def importFactory(name):
+    # the factory function named module.function
+    module_name, function_name = name.rsplit('.', 1)
+    return getattr(__import__(module_name, fromlist=[function_name]), function_name)
+
+if __name__ == '__main__':
+    if len(sys.argv) not in [4, 5]:
+        print('Usage: python scrapepipeline.py <module.factory> <html directory> <output directory> [processes]')
+        sys.exit()
+    processes = None
+    if len(sys.argv) == 5:
+        processes = int(sys.argv[4])
+    if not os.path.isdir(sys.argv[3]):
+        os.makedirs(sys.argv[3])
+    pages = listDocuments(sys.argv[2])
+    written, errors, seconds = scrapePages(pages, importFactory(sys.argv[1]), exportWriter(sys.argv[3]), processes)
+    for key, problem in errors:
+        print('ERROR: %s was not scraped: %s' % (key, problem))
+    print('Scraped %s pages in %.2f seconds (%.1f pages/sec)' % (written, seconds, (written + len(errors)) / max(seconds, 0.000001)))
+    if errors:
+        sys.exit(1)
@@ -0,0 +1,163 @@
+# Python File solrbatch.py
+
+"""
+This packs documents into solr xml update payloads, so that many documents
+go to solr in one request instead of one file (and one request) each.
+Run it as:
+python solrbatch.py <directory or glob> <output directory> [documents [bytes]]
+which reads every solr xml file of the directory (or matching the glob)
+and writes their documents again as payloads add-00000.xml, add-00001.xml...
+
+packDocuments takes a stream of documents, each one a StructuredDocument
+(or a single node of one), whose roots are mapped to fields by
+solrDocuments, or a dictionary of field name -> value, and yields payloads
+of the form
+<add><doc><field name="id">...</field>...</doc>...</add>
+holding at most max_documents documents and at most max_bytes bytes,
+whichever limit comes first (a document bigger than max_bytes gets a
+payload to itself). A field with a list of values is written once per
+value, a FieldView (see fieldextractor.py) as its content and the
+_childDocuments_ of solrDocument as nested docs.
+
+Values are escaped (and the characters xml can't hold at all are dropped),
+except with markup, which says they are xml text already. That is the case
+for the content of the documents the XMLExtractor builds, as it leaves
+entities such as &amp; as they were in the file, so the command line uses
+markup.
+
+A payload is utf-8 without an xml declaration, ready to be posted as is
+(SolrClient.UpdateXML or BulkIndexer.Post in Startup) or written to a
+directory that index.py posts with the BulkIndexer.
+"""
+
+import os
+import re
+import sys
+import time
+from xml.sax.saxutils import escape, quoteattr
+from markupcreator import solrDocuments
+from xmlextractor import XMLExtractor
+from documentfiles import listCorpus
+
+MAX_DOCUMENTS = 1000
+MAX_BYTES = 1024 * 1024
+
+# the characters xml 1.0 doesn't allow, not even as references
+invalid_expression = re.compile(u'[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]')
+
+def packDocuments(documents, max_documents=MAX_DOCUMENTS, max_bytes=MAX_BYTES, markup=False):
+    # yields the payloads of the documents, in the order they came in. The
+    # size of a payload counts the <add></add> around its docs too
+    pieces = []
+    size = len(payload([]))
+    for fields in documentFields(documents):
+        doc = docXML(fields, markup).encode('utf-8')
+        if pieces and (len(pieces) == max_documents or size + len(doc) > max_bytes):
+            yield payload(pieces)
+            pieces = []
+            size = len(payload([]))
+        pieces.append(doc)
+        size = size + len(doc)
+    if pieces:
+        yield payload(pieces)
+
+def payload(pieces):
+    return '<add>%s</add>' % ''.join(pieces)
+
+def documentFields(documents):
+    # yields the fields of every solr document in documents
+    for document in documents:
+        if isinstance(document, dict):
+            yield document
+        elif hasattr(document, 'nodes'):
+            for root in document.nodes:
+                for fields in solrDocuments(root):
+                    yield fields
+        else:
+            for fields in solrDocuments(document):
+                yield fields
+
+def docXML(fields, markup=False):
+    # a <doc> holding fields, as unicode. Nested docs are written from a
+    # stack of (fields still to write, closing tag) instead of calling
+    # ourselves, a child document being the pair (None, its fields)
+    pieces = [u'<doc>']
+    pending = [(iter(fields.items()), u'</doc>')]
+    while pending:
+        item = next(pending[-1][0], None)
+        if item is None:
+            pieces.append(pending.pop()[1])
+            continue
+        name, value = item
+        if name is None:
+            pieces.append(u'<doc>')
+            pending.append((iter(value.items()), u'</doc>'))
+        elif name == '_childDocuments_':
+            pending.append((((None, child) for child in value), u''))
+        else:
+            if not isinstance(value, (list, tuple)):
+                value = [value]
+            for one in value:
+                if one is not None:
+                    pieces.append(u'<field name=%s>%s</field>' % (quoteattr(xmlText(name)), fieldText(one, markup)))
+    return u''.join(pieces)
+
+def fieldText(value, markup):
+    # the text of a field value as it goes between the field tags
+    if hasattr(value, 'content'):
+        value = value.content
+        if value is None:
+            return u''
+    if isinstance(value, bool):
+        return value and u'true' or u'false'
+    if markup:
+        return toUnicode(value)
+    return escape(xmlText(value))
+
+def xmlText(value):
+    return invalid_expression.sub(u'', toUnicode(value))
+
+def toUnicode(value):
+    if isinstance(value, unicode):
+        return value
+    if isinstance(value, str):
+        return value.decode('utf-8')
+    return unicode(value)
+
+def fileDocuments(addresses):
+    # yields the roots of the solr xml files at addresses, one at a time
+    for address in addresses:
+        xml_extractor = XMLExtractor()
+        xml_extractor.InputFile(address)
+        try:
+            for root in xml_extractor.StreamNodes():
+                yield root
+        finally:
+            xml_extractor.Close()
+
+def writePayloads(payloads, output_directory):
+    # writes each payload to a file of its own and returns their addresses
+    addresses = []
+    for body in payloads:
+        address = os.path.join(output_directory, 'add-%05d.xml' % len(addresses))
+        file = open(address, 'wb')
+        file.write(body)
+        file.close()
+        addresses.append(address)
+    return addresses
+
+if __name__ == '__main__':
+    if len(sys.argv) not in [3, 4, 5]:
+        print('Usage: python solrbatch.py <directory or glob> <output directory> [documents [bytes]]')
+        sys.exit()
+    max_documents = MAX_DOCUMENTS
+    max_bytes = MAX_BYTES
+    if len(sys.argv) > 3:
+        max_documents = int(sys.argv[3])
+    if len(sys.argv) > 4:
+        max_bytes = int(sys.argv[4])
+    if not os.path.isdir(sys.argv[2]):
+        os.makedirs(sys.argv[2])
+    start = time.time()
+    addresses = writePayloads(packDocuments(fileDocuments(listCorpus(sys.argv[1])), max_documents, max_bytes, True), sys.argv[2])
+    print('Wrote %s payloads in %.2f seconds' % (len(addresses), time.time() - start))
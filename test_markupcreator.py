@@ -0,0 +1,132 @@
+# Python File test_markupcreator.py
+
+"""
+Tests of the DocumentBuilder of markupcreator.py, of streaming roots out
+of a CompactStructuredDocument and of the text of streamed html. Run them
+with:
+python -m unittest test_markupcreator
+"""
+
+import unittest
+import io
+import instrumentation
+from markupcreator import StructuredDocument, CompactStructuredDocument, StructureException, DocumentNode, HTMLExtractor
+
+class DocumentBuilderTest(unittest.TestCase):
+
+    def documents(self):
+        return [StructuredDocument(), CompactStructuredDocument()]
+
+    def testElement(self):
+        for document in self.documents():
+            builder = document.Builder()
+            with builder.Element('ul', id='menu'):
+                builder.Node('li', 'first')
+                with builder.Element('li', 'second'):
+                    builder.Node('a', 'link')
+            self.assertEqual([node.name for node in document.PreOrder()], ['ul', 'li', 'li', 'a'])
+            self.assertEqual([node.content for node in document.FindAll('li')], ['first', 'second'])
+
+    def testElementClosesWhenTheBlockRaises(self):
+        for document in self.documents():
+            builder = document.Builder()
+            try:
+                with builder.Element('ul'):
+                    builder.Node('li')
+                    raise ValueError('in the block')
+            except ValueError:
+                pass
+            self.assertEqual(builder.open, [])
+            builder.Node('p')
+            self.assertEqual([node.name for node in document.nodes], ['ul', 'p'])
+
+    def testElementKeepsTheErrorOfTheBlock(self):
+        # the block leaves a node in creation, which Close would refuse
+        for document in self.documents():
+            builder = document.Builder()
+            def block():
+                with builder.Element('ul'):
+                    document.CreateChild('li')
+                    raise KeyError('in the block')
+            self.assertRaises(KeyError, block)
+
+    def testBuild(self):
+        for document in self.documents():
+            builder = document.Builder()
+            top = builder.Build(('div', None, {'name': 'x'}, (('p', str(i)) for i in range(3))))
+            self.assertEqual(top.attributes, {'name': 'x'})
+            self.assertEqual([child.content for child in top.children], ['0', '1', '2'])
+
+    def testBuildRefusesNone(self):
+        builder = StructuredDocument().Builder()
+        self.assertRaises(StructureException, builder.Build, ('div', None, None, [('p',), None, ('p',)]))
+
+    def testMisuse(self):
+        builder = StructuredDocument().Builder()
+        self.assertRaises(StructureException, builder.Close)
+        self.assertRaises(StructureException, builder.Build, 'div')
+
+class StreamingTest(unittest.TestCase):
+
+    def events(self, roots):
+        events = []
+        for i in range(roots):
+            events.extend([('start', 'doc', {'id': str(i)}), ('start', 'title', {}), ('content', 'title %s' % i),
+                ('end', 'title'), ('start', 'body', {}), ('start', 'p', {}), ('content', 'text %s' % i),
+                ('end', 'p'), ('end', 'body'), ('end', 'doc')])
+        return events
+
+    def testCompactArraysAreFreed(self):
+        document = CompactStructuredDocument()
+        roots = []
+        for root in document.ApplyEvents(self.events(50), False):
+            self.assertEqual(len(document.name_ids), 0)
+            self.assertEqual(len(document.contents), 0)
+            roots.append(root)
+        self.assertEqual(document.nodes, [])
+        self.assertEqual([root.attributes['id'] for root in roots], [str(i) for i in range(50)])
+        self.assertEqual(roots[7].children[1].children[0].content, 'text 7')
+        self.assertEqual(roots[7].children[1].older_sibling.content, 'title 7')
+
+    def testCompactStreamAfterKeptRoots(self):
+        # the streamed roots come after a root the document keeps
+        document = CompactStructuredDocument()
+        document.Builder().Build(('kept', None, {}, [('child', 'kept child')]))
+        roots = list(document.ApplyEvents(self.events(3), False))
+        self.assertEqual(len(document.name_ids), 2)
+        self.assertEqual(document.nodes[0].children[0].content, 'kept child')
+        self.assertEqual([node.content for node in roots[2].children[1].children], ['text 2'])
+        self.assertEqual(roots[2].children[1].children[0].parent.name, 'body')
+
+class HTMLStreamTest(unittest.TestCase):
+
+    def text(self, page, chunk_size):
+        extractor = HTMLExtractor('')
+        extractor.AddExtractor(DocumentNode('p'), extractor.plainTextExtractor)
+        extractor.CHUNK_SIZE = chunk_size
+        extractor.AddStream(io.BytesIO(page.encode('utf-8')))
+        extractor.ExtractHTML()
+        return extractor.document.nodes[0].content
+
+    def testReferences(self):
+        # references that can't be decoded keep their text, ; and all
+        page = u'<html><p>&x;|&x|&amp;x;|&amp;y|&#65;&#65|&#99999999;|&#99999999 end</p></html>'
+        for chunk_size in [1, 2, 7, 4096]:
+            self.assertEqual(self.text(page, chunk_size), u'&x;|&x|&x;|&y|AA|&#99999999;|&#99999999 end')
+
+    def testRuleNames(self):
+        # the stats name the rule each element was dispatched by
+        extractor = HTMLExtractor('')
+        node = DocumentNode('div')
+        node.attributes['id'] = 'main'
+        extractor.AddExtractor(node, extractor.extractChildren)
+        extractor.AddExtractor(DocumentNode('p'), extractor.plainTextExtractor)
+        with instrumentation.instrumented() as stats:
+            extractor.AddStream(u'<html><div id="main"><p>a</p><span>b</span></div><p>c</p></html>')
+            extractor.ExtractHTML()
+        self.assertEqual(stats.counters['dispatch div id="main"'], 1)
+        self.assertEqual(stats.counters['dispatch p'], 2)
+        self.assertEqual(stats.counters['dispatch noAction'], 1)
+
+if __name__ == '__main__':
+    unittest.main()
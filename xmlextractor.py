@@ -28,16 +28,39 @@ nodes unfinished before going onto the next node, StructureDocument won't let us
 do this (which is exactly what I wanted). So, we will assume we are working with
 well formatted xml or html.
 """
-from markupcreator import StructuredDocument
+from markupcreator import StructuredDocument, ContentSpan, LazyDocumentNode
+import io
 import re
+import mmap
+import instrumentation
+
+class MarkupException(Exception):
+    def __init__(self, problem):
+        self.problem = problem
+    def __str__(self):
+        return 'ERROR: markup extraction failed because of the problem: %s' % self.problem
 
 class XMLExtractor:
 
-    def __init__(self, directory=''):
-        self.document = StructuredDocument(directory)
+    def __init__(self, directory='', document_class=StructuredDocument, cache=None, single_pass=False, strict=False):
+        # document_class can be set to CompactStructuredDocument for big files
+        # and cache to a ParseCache (see parsecache.py) shared with other
+        # extractors reading the same files. single_pass uses the
+        # MarkupScanner (at the bottom of this file) instead of the tag
+        # expression to find the tags. With strict, an end tag that doesn't
+        # match or a tag that is never closed raises a MarkupException
+        # instead of the extraction stopping where it is
+        self.document_class = document_class
+        self.single_pass = single_pass
+        self.strict = strict
+        self.document = document_class(directory)
         self.directory = directory
+        self.cache = cache
         self.special = {}
         self.file = None
+        self.mapped = None  # the memory map of the file (see InputFile)
+        self.address = None
+        self.chunk_size = 64 * 1024 # bytes read at a time from the file
         self.tag_expression = re.compile('<(\/)?([^ <>\/]*)?( [^<>\/]*)? *(\/)?>')
             # the first group in that will hold the / if it exist at the beginning
             # the second group holds the first thing in our tag besides. If it is
@@ -85,8 +108,8 @@ class XMLExtractor:
     """
     The following method works in the following way:
     First it checks to make sure we have a file ready to be opened.
-    Then it grabs the contents of that file.
-    Then it applies finditer on the file using the tag expression.
+    Then it reads that file in chunks.
+    Then it applies finditer on the chunks using the tag expression.
     Then, it finds the first expression. If it is special it runs the
     special extractor using the dictionary attached to self.
     If it is not special it checks to see what the first group is like
@@ -108,73 +131,217 @@ class XMLExtractor:
     we check to see if the last tag found also had a non-empty group one. If so
     we finish children and jump up a parent, if not we finish the previous node.
 
+    This work is split in three: scan finds the tags, generateEvents turns
+    them into start, content and end events, and the StructuredDocument builds
+    its nodes from those events in ApplyEvents.
     """
-    def InputFile(self, address):
+    def InputFile(self, address, mapped=False):
+        # with mapped the file is memory mapped and CreateDocument scans the
+        # map itself, leaving the content of the nodes as spans of it that
+        # are only decoded when the content is read (see LazyDocumentNode).
+        # That way a big file isn't read into memory, and the content nobody
+        # reads is never decoded. (An empty file can't be mapped, so it is
+        # read as usual). The map is kept until Close, as the content of
+        # the nodes is read from it
+        self.Close()
         self.file = open(address, 'rb')
+        self.mapped = None
+        self.address = address
+        if mapped:
+            try:
+                self.mapped = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                pass
+
+    def InputString(self, contents, address=None):
+        # for contents that have already been read from a file (give its
+        # address if you want the cache to be used)
+        self.Close()
+        self.file = io.BytesIO(contents)
+        self.mapped = None
+        self.address = address
 
     def CreateDocument(self):
+        # once the document is built the file is closed, as it has been read
+        # in full. Only the map of a mapped file is kept (until Close), as
+        # the content of the nodes is still to be read from it
         if not self.file:
             return
-        # now we flush the self.document
-        self.document = StructuredDocument(self.directory)
-        # read the file
-        contents = self.file.read()
+        lazy = self.mapped is not None and not self.single_pass and not (self.cache and self.address)
+        try:
+            if self.cache and self.address:
+                self.document = self.cache.Document(self)
+                return
+            # now we flush the self.document
+            self.document = self.document_class(self.directory)
+            # and build it from the events of the whole file, keeping every root
+            if lazy:
+                self.document.node_class = LazyDocumentNode
+                tags = self.scanMapped()
+                stats = instrumentation.current
+                if stats:
+                    stats.Count('bytes scanned', len(self.mapped))
+                    tags = stats.Timed('parse', tags, 'tags scanned')
+                events = self.generateEvents(tags)
+            else:
+                events = self.generateEvents(self.scan(self.readChunks()))
+            for node in self.document.ApplyEvents(events):
+                pass
+        finally:
+            self.file.close()
+            self.file = None
+            if not lazy:
+                self.closeMap()
 
-        # declaration of variables that will be used in the following loop
-        content_between_tags = ''
-        names = []
-        previous_group1_content = True # for correct behavior
-        previous_tag_end = 0
-        previous_tag_complete = False
-        for match in re.finditer(self.tag_expression, contents):
+    def Close(self):
+        # closes the file and its map. The content of the nodes of a mapped
+        # file can't be read after this (read it first, or keep the
+        # extractor open while you use the document)
+        if self.file:
+            self.file.close()
+            self.file = None
+        self.closeMap()
+
+    def closeMap(self):
+        if self.mapped is not None:
+            self.mapped.close()
+            self.mapped = None
+
+    """
+    The streaming methods below do the same work as CreateDocument but never
+    hold more than a chunk of the file (plus the content of the tag being
+    read) in memory. StreamEvents yields the events themselves:
+    ('start', name, attributes)     a start or complete tag
+    ('content', text)               the content of the last started tag
+    ('end', name)                   an end tag (complete tags get one too)
+    and StreamNodes yields each root node as soon as its end tag has been read.
+    The roots it yields are not kept in self.document, so memory depends on
+    how deep the document is nested, not on how big the file is.
+    """
+    def StreamEvents(self, chunk_size=None):
+        if not self.file:
+            return iter([])
+        return self.generateEvents(self.scan(self.readChunks(chunk_size)))
+
+    def StreamNodes(self, chunk_size=None):
+        self.document = self.document_class(self.directory)
+        return self.document.ApplyEvents(self.StreamEvents(chunk_size), False)
+
+    def readChunks(self, chunk_size=None):
+        if not chunk_size:
+            chunk_size = self.chunk_size
+        chunk = self.file.read(chunk_size)
+        while chunk:
+            yield chunk
+            chunk = self.file.read(chunk_size)
+
+    def scan(self, chunks):
+        # yields a tuple for every tag that is not special of:
+        # (content_between_tags, is end tag, name, attributes, is complete, tag text)
+        stats = instrumentation.current
+        if stats:
+            chunks = stats.Counted('bytes scanned', chunks)
+        if self.single_pass:
+            tags = MarkupScanner(self, chunks).Tags()
+        else:
+            tags = self.scanTags(chunks)
+        if stats:
+            tags = stats.Timed('parse', tags, 'tags scanned')
+        return tags
+
+    def scanTags(self, chunks):
+        # this runs the tag expression over the chunks and yields the tags
+        # that are not special (see scan).
+        # A tag can't contain a < or a >, so whatever comes after the last <
+        # that has no > behind it might be a tag cut in two. We hold that
+        # back and scan it again together with the next chunk.
+        # Note special tags don't end the content between tags, they are
+        # part of it (just as they were before)
+        pending = []    # pieces of content since the last tag that wasn't special
+        buffer = ''
+        chunks = iter(chunks)
+        finished = False
+        while not finished:
+            chunk = next(chunks, None)
+            if chunk is None:
+                finished = True
+                end = len(buffer)
+            else:
+                buffer = buffer + chunk
+                end = buffer.rfind('<')
+                if end == -1 or buffer.rfind('>') > end:
+                    end = len(buffer)
+            position = 0
+            for match in self.tag_expression.finditer(buffer, 0, end):
+                pending.append(buffer[position:match.start()])
+                position = match.end()
+                if match.group(2) in self.special:
+                    self.extract(match.group(2)) # extract
+                    pending.append(match.group(0))
+                    continue
+                attributes = {}
+                if match.group(3) and not match.group(1):
+                    attributes = self.grabAttributes(match.group(3))
+                yield ''.join(pending), match.group(1) == '/', match.group(2), attributes, match.group(4) == '/', match.group(0)
+                pending = []
+            pending.append(buffer[position:end])
+            buffer = buffer[end:]
+
+    def scanMapped(self):
+        # this is scanTags run over the whole memory map at once, except that
+        # the content between tags is a ContentSpan of the map instead of a
+        # string. The map is only read where the expression reads it and
+        # nothing is copied but the tags themselves
+        mapped = self.mapped
+        start = 0   # where the content since the last tag that wasn't special starts
+        for match in self.tag_expression.finditer(mapped):
             if match.group(2) in self.special:
                 self.extract(match.group(2)) # extract
                 continue
-            content_between_tags = contents[previous_tag_end: match.start()]
-            if not match.group(1):
-                if previous_group1_content == False and not previous_tag_complete:
-                    # here we need to finish the last node as a parent
-                    self.document.AddContent(content_between_tags.decode('utf-8'))
-                    self.document.FinishNode(True)
-                # now we handle the current node
-                name = match.group(2)
-                names.append(name)
-                if self.document.current_parent:
-                    self.document.CreateChild(name)
-                else:
-                    self.document.CreateNode(name)
-                # now we need to get the attributes
-                if match.group(3):
-                    self.document.AddAttributes(**self.grabAttributes(match.group(3)))
+            attributes = {}
+            if match.group(3) and not match.group(1):
+                attributes = self.grabAttributes(match.group(3))
+            content = ContentSpan(mapped, start, match.start() - start)
+            yield content, match.group(1) == '/', match.group(2), attributes, match.group(4) == '/', match.group(0)
+            start = match.end()
+
+    def decode(self, content_between_tags):
+        # spans are left for the node to decode when its content is read
+        if isinstance(content_between_tags, ContentSpan):
+            return content_between_tags
+        return content_between_tags.decode('utf-8')
+
+    def generateEvents(self, tags):
+        # this turns the tags into events following the logic explained above
+        # CreateDocument. Content is only reported for a start tag whose next
+        # tag comes before its end tag, and it is reported right before that
+        # next tag's event
+        names = []
+        previous_tag_open = False   # the last tag was a start tag that wasn't complete
+        for content_between_tags, end, name, attributes, complete, text in tags:
+            if not end:
+                if previous_tag_open:
+                    yield ('content', self.decode(content_between_tags))
+                yield ('start', name, attributes)
                 # the following handles complete tags
-                previous_tag_complete = False
-                if match.group(4) == '/':
-                    previous_tag_complete = True
-                    self.document.FinishNode()
-                    names = names[:-1] # remove the name we just added as it is finished
-                previous_group1_content = False # set for the next round
-                previous_tag_end = match.end()
-            elif match.group(1) == '/':
-                if match.group(2) != names[-1]:
+                previous_tag_open = not complete
+                if previous_tag_open:
+                    names.append(name)
+                else:
+                    yield ('end', name)
+            else:
+                if not names or name != names[-1]:
                     # in this case we have a serious problem
-                    print('Problem with structured syntax with tag: ' + match.group(0))
+                    if self.strict:
+                        raise MarkupException('Problem with structured syntax with tag: ' + text)
+                    print('Problem with structured syntax with tag: ' + text)
                     return
-                # now we can just check to see if we are jumping up a parent.
-                if previous_group1_content == True or previous_tag_complete:
-                    # now we know we are finishing off a parent (which means the
-                    # node has been finished but we need to finish children)
-                    self.document.FinishChildren()
-                elif previous_group1_content == False and not previous_tag_complete:
-                    # we first need to add the content before we finish
-                    content_between_tags = contents[previous_tag_end: match.start()]
-                    self.document.AddContent(content_between_tags.decode('utf-8'))
-                    self.document.FinishNode()
-                names = names[:-1] # we should remove this name now
-                previous_group1_content = True
-                previous_tag_end = match.end()
-                previous_tag_complete = False
-
-
+                if previous_tag_open:
+                    yield ('content', self.decode(content_between_tags))
+                yield ('end', names.pop())
+                previous_tag_open = False
+        if names and self.strict:
+            raise MarkupException('the tag %s is never closed' % names[-1])
 
     def grabAttributes(self, attributes_string):
         attributes = {}
@@ -192,3 +359,214 @@ class XMLExtractor:
             return extractor(string, *args)
         else:
             return extractor(string)
+
+class MarkupScanner:
+    """
+    This finds the tags of a document in a single pass, as an alternative to
+    running the tag expression and then the attribute expression. It starts at
+    every < and reads what follows:
+    <!-- ... -->            a comment, special '!--'
+    <![CDATA[ ... ]]>       its text is content
+    <?name ... ?>           a processing instruction, special '?name'
+    <!name ... >            a declaration such as doctype, special '!name'
+    </name>                 an end tag
+    <name attrs> <name attrs />     a start or complete tag
+    Comments, processing instructions and declarations are never taken for
+    tags, whatever they hold, and are kept in the content just as the tag
+    expression keeps special tags. Attribute values may be quoted with " or '
+    and then hold spaces, slashes and >. The quotes are kept in the value (as
+    the attribute expression does). A < that doesn't start any of the above
+    is content.
+
+    Every search moves forward with str.find or a regular expression that
+    can't backtrack, and a construct that is cut off by the end of the
+    buffer is read again only once the buffer has at least doubled, so the
+    time taken is linear in the size of the file.
+    """
+    tag_expression = re.compile('<([^\\s<>/!?]+)((?:\\s+[^\\s<>/="\']+\\s*=\\s*(?:"[^"]*"|\'[^\']*\'))*)\\s*(/?)>')
+        # the common case of a tag whose values are all quoted. Every piece of
+        # it ends where the next can't start, so it can't backtrack much
+    quoted_attribute_expression = re.compile('([^\\s<>/="\']+)\\s*=\\s*("[^"]*"|\'[^\']*\')')
+    name_expression = re.compile('[^\\s<>/]+')
+    space_expression = re.compile('\\s*')
+    attribute_name_expression = re.compile('[^\\s<>/="\']+')
+    unquoted_value_expression = re.compile('[^\\s<>"\']+')
+
+    def __init__(self, xml_extractor, chunks):
+        self.xml_extractor = xml_extractor
+        self.chunks = iter(chunks)
+        self.buffer = ''
+        self.finished = False
+        self.absent = {}    # at the end of the file: string -> position after which it isn't found
+
+    def readMore(self, position):
+        # drops the buffer before position and reads at least as much again
+        # as is left. Returns False if we are at the end of the file
+        if self.finished:
+            return False
+        pieces = [self.buffer[position:]]
+        wanted = max(len(pieces[0]), 1)
+        read = 0
+        while read < wanted:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                self.finished = True
+                break
+            pieces.append(chunk)
+            read = read + len(chunk)
+        self.buffer = ''.join(pieces)
+        return True
+
+    def find(self, string, position):
+        # buffer.find that remembers a failed search at the end of the file
+        # so a broken document can't make us search the rest of it again and again
+        if self.finished and position >= self.absent.get(string, len(self.buffer) + 1):
+            return -1
+        found = self.buffer.find(string, position)
+        if found == -1 and self.finished:
+            self.absent[string] = min(position, self.absent.get(string, position))
+        return found
+
+    def Tags(self):
+        # yields the tags like XMLExtractor.scanTags does
+        pending = []    # pieces of content since the last tag that wasn't special
+        position = 0
+        self.readMore(0)
+        while True:
+            start = self.buffer.find('<', position)
+            if start == -1:
+                pending.append(self.buffer[position:])
+                if not self.readMore(len(self.buffer)):
+                    break
+                position = 0
+                continue
+            pending.append(self.buffer[position:start])
+            token = self.readConstruct(start)
+            if token is None:
+                # cut off by the end of the buffer
+                if self.readMore(start):
+                    position = 0
+                    continue
+                token = False
+            if token is False:
+                # not markup, so the < is content
+                pending.append('<')
+                position = start + 1
+                continue
+            kind, value, position = token
+            if kind == 'special':
+                self.xml_extractor.extract(value)
+                pending.append(self.buffer[start:position])
+            elif kind == 'cdata':
+                pending.append(value)
+            else:
+                end, name, attributes, complete = value
+                yield ''.join(pending), end, name, attributes, complete, self.buffer[start:position]
+                pending = []
+
+    def readConstruct(self, start):
+        # returns (kind, value, end position), None if the buffer ends before
+        # the construct does, or False if there is no markup at start
+        buffer = self.buffer
+        if buffer.startswith('<!--', start):
+            end = self.find('-->', start + 4)
+            if end == -1:
+                return None
+            return 'special', '!--', end + 3
+        if buffer.startswith('<![CDATA[', start):
+            end = self.find(']]>', start + 9)
+            if end == -1:
+                return None
+            return 'cdata', buffer[start + 9:end], end + 3
+        if buffer.startswith('<?', start) or buffer.startswith('<!', start):
+            name = self.name_expression.match(buffer, start + 2)
+            if buffer.startswith('<?', start):
+                end = self.find('?>', start + 2)
+                length = 2
+            else:
+                end = self.find('>', start + 2)
+                length = 1
+            if end == -1:
+                return None
+            key = buffer[start + 1]
+            if name and name.end() <= end:
+                key = key + name.group()
+            return 'special', key, end + length
+        if buffer.startswith('</', start):
+            name = self.name_expression.match(buffer, start + 2)
+            if not name:
+                return self.cutOff(start + 2)
+            position = self.space_expression.match(buffer, name.end()).end()
+            if position >= len(buffer):
+                return None
+            if buffer[position] != '>':
+                return False
+            return 'tag', (True, name.group(), {}, False), position + 1
+        return self.readTag(start)
+
+    def cutOff(self, position):
+        # None if position is past the buffer (we need to read more), False if not
+        if position >= len(self.buffer):
+            return None
+        return False
+
+    def readTag(self, start):
+        buffer = self.buffer
+        match = self.tag_expression.match(buffer, start)
+        if match:
+            attributes = {}
+            if match.group(2):
+                attributes = dict(self.quoted_attribute_expression.findall(match.group(2)))
+            return 'tag', (False, match.group(1), attributes, match.group(3) == '/'), match.end()
+        name = self.name_expression.match(buffer, start + 1)
+        if not name:
+            return self.cutOff(start + 1)
+        attributes = {}
+        position = name.end()
+        while True:
+            position = self.space_expression.match(buffer, position).end()
+            if position >= len(buffer):
+                return None
+            character = buffer[position]
+            if character == '>':
+                return 'tag', (False, name.group(), attributes, False), position + 1
+            if character == '/':
+                if position + 1 >= len(buffer):
+                    return None
+                if buffer[position + 1] == '>':
+                    return 'tag', (False, name.group(), attributes, True), position + 2
+                position = position + 1
+                continue
+            if character == '<':
+                return False
+            key = self.attribute_name_expression.match(buffer, position)
+            if not key:
+                # a stray = or quote
+                position = position + 1
+                continue
+            position = self.space_expression.match(buffer, key.end()).end()
+            if position >= len(buffer):
+                return None
+            if buffer[position] != '=':
+                continue    # an attribute without a value, which we skip
+            position = self.space_expression.match(buffer, position + 1).end()
+            if position >= len(buffer):
+                return None
+            quote = buffer[position]
+            if quote == '"' or quote == "'":
+                end = self.find(quote, position + 1)
+                if end == -1:
+                    return None
+                attributes[key.group()] = buffer[position:end + 1]
+                position = end + 1
+                continue
+            value = self.unquoted_value_expression.match(buffer, position)
+            if not value:
+                continue
+            position = value.end()
+            value = value.group()
+            if value.endswith('/') and buffer.startswith('>', position):
+                # <name key=value/> is complete
+                value = value[:-1]
+                position = position - 1
+            attributes[key.group()] = value